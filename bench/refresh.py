@@ -0,0 +1,192 @@
+'''
+End-to-end refresh benchmark against the local GoTrain stand-in.
+
+    python -m bench.refresh --stations 1 4 16 --latency 30
+
+Reports per-refresh latency, requests per refresh, parse throughput
+(departures per second through Departures._update_departures), the
+memory held by a station's departures, and parse time and peak memory of
+streaming against fully loading a hub station's departures document.
+'''
+import argparse
+import contextlib
+import io
+import statistics
+import sys
+import time
+import tracemalloc
+
+import constants
+
+from bench.server import GoTrainStandIn, base_url, serve
+from ns import api, cache, stations
+from ns.governor import governor
+
+
+def _quiet(fn, *args):
+    # Departures log every refresh, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args)
+
+
+def _percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def bench_refresh(standin: GoTrainStandIn, n_stations: int, rounds: int, limit: int) -> dict:
+    '''
+    Refresh n_stations like the scheduler does, from a cold cache.
+    '''
+    cache.compositions.clear()
+    codes = list(stations.codes)[:n_stations]
+    departures = [api.Departures(code, limit=limit) for code in codes]
+
+    latencies = []
+    requests_before = standin.requests
+    cold_requests = None
+    for r in range(rounds):
+        for d in departures:
+            start = time.perf_counter()
+            _quiet(d.refresh)
+            latencies.append(time.perf_counter() - start)
+        if r == 0:
+            cold_requests = standin.requests - requests_before
+
+    refreshes = rounds * n_stations
+    warm_refreshes = refreshes - n_stations
+    warm_requests = standin.requests - requests_before - cold_requests
+    return {
+        'stations': n_stations,
+        'refreshes': refreshes,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p95_ms': _percentile(latencies, 0.95) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'cold_requests': cold_requests / n_stations,
+        'warm_requests': warm_requests / warm_refreshes if warm_refreshes else 0,
+    }
+
+
+def bench_parse(standin: GoTrainStandIn, n_stations: int, rounds: int) -> dict:
+    '''
+    Parse every departure of every station, compositions already cached.
+    '''
+    codes = list(stations.codes)[:n_stations]
+    departures = [api.Departures(code, limit=standin.departures, incremental=False) for code in codes]
+    for d in departures:
+        _quiet(d.refresh)  # Warm the composition cache
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for d in departures:
+            _quiet(d.refresh)
+    elapsed = time.perf_counter() - start
+    parsed = rounds * n_stations * standin.departures
+    return {
+        'stations': n_stations,
+        'departures_per_sec': parsed / elapsed,
+    }
+
+
+def _deep_size(o) -> int:
+    size = sys.getsizeof(o)
+    if isinstance(o, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in o.items())
+    elif isinstance(o, (list, tuple)):
+        size += sum(_deep_size(v) for v in o)
+    return size
+
+
+def bench_memory(standin: GoTrainStandIn, limit: int) -> dict:
+    '''
+    Bytes held by the departures of one station, against the same trains as dicts.
+    '''
+    d = api.Departures(list(stations.codes)[0], limit=limit)
+    _quiet(d.refresh)
+    trains = d.get_trains()
+    return {
+        'trains': len(trains),
+        'records': _deep_size(d.snapshot),
+        'dicts': _deep_size([t._asdict() for t in trains]),
+    }
+
+
+def bench_streaming(standin: GoTrainStandIn, limit: int, rounds: int) -> list[dict]:
+    '''
+    Refresh a hub station with and without streaming the departures document.
+    '''
+    results = []
+    for streaming in (False, True):
+        d = api.Departures(list(stations.codes)[0], limit=limit, incremental=False, streaming=streaming)
+        _quiet(d.refresh)  # Warm the stand-in and composition cache
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(rounds):
+            _quiet(d.refresh)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results.append({
+            'mode': 'stream' if streaming else 'full',
+            'ms': elapsed / rounds * 1000,
+            'peak_kb': peak / 1024,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Departures refresh benchmark')
+    parser.add_argument('--stations', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=7)
+    parser.add_argument('--latency', type=float, default=20, help='stand-in latency in ms')
+    parser.add_argument('--jitter', type=float, default=5, help='stand-in jitter in ms')
+    parser.add_argument('--departures', type=int, default=40, help='departures per station')
+    parser.add_argument('--stops', type=int, default=12, help='stops per service')
+    parser.add_argument('--hub-departures', type=int, default=500, help='departures at the hub station')
+    parser.add_argument('--qps', type=float, default=1000,
+                        help='governor request rate, the default keeps it out of the measurements')
+    parser.add_argument('--concurrency', type=int, default=api.COMPOSITION_WORKERS,
+                        help='governor requests in flight')
+    args = parser.parse_args()
+
+    governor.qps = governor.burst = args.qps
+    governor.concurrency = args.concurrency
+
+    standin = GoTrainStandIn(departures=args.departures, stops=args.stops,
+                             latency=args.latency / 1000, jitter=args.jitter / 1000)
+    server = serve(standin)
+    constants.gotrain_api_base_url = base_url(server)
+
+    print(f'Refresh, {args.latency}ms latency, {args.departures} departures/station, limit {args.limit}')
+    print(f'{"stations":>8} {"mean ms":>9} {"p95 ms":>9} {"max ms":>9} {"req cold":>9} {"req warm":>9}')
+    for n in args.stations:
+        r = bench_refresh(standin, n, args.rounds, args.limit)
+        print(f'{r["stations"]:>8} {r["mean_ms"]:>9.1f} {r["p95_ms"]:>9.1f} {r["max_ms"]:>9.1f} '
+              f'{r["cold_requests"]:>9.1f} {r["warm_requests"]:>9.1f}')
+
+    # Parse throughput without network latency
+    standin.latency = standin.jitter = 0
+    print('\nParse throughput')
+    print(f'{"stations":>8} {"dep/s":>9}')
+    for n in args.stations:
+        r = bench_parse(standin, n, args.rounds)
+        print(f'{r["stations"]:>8} {r["departures_per_sec"]:>9.0f}')
+
+    r = bench_memory(standin, args.limit)
+    print(f'\nMemory per station, {r["trains"]} trains')
+    print(f'records {r["records"]:>7} bytes')
+    print(f'dicts   {r["dicts"]:>7} bytes')
+
+    standin.departures = args.hub_departures
+    print(f'\nHub station, {args.hub_departures} departures, limit {args.limit}')
+    print(f'{"mode":>8} {"ms":>9} {"peak kB":>9}')
+    for r in bench_streaming(standin, args.limit, args.rounds):
+        print(f'{r["mode"]:>8} {r["ms"]:>9.1f} {r["peak_kb"]:>9.0f}')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
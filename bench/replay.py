@@ -0,0 +1,76 @@
+'''
+Push a recorded log (board.py --record) through the parser and the
+renderer as fast as possible, e.g. a full day of traffic in minutes.
+
+    python -m bench.replay traffic.jsonl.gz
+
+Reports the replayed span against the time it took, and the time spent
+per refresh and per rendered frame.
+'''
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+from headless import ImageRenderer
+from layout import number_of_trains, pad_trains
+from ns import api, replay, timeparse, transport
+
+
+class NullTarget:
+    # Rendering without writing the frames anywhere
+    def write(self, image, bands: list):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded GoTrain traffic')
+    parser.add_argument('log', help='gzipped log written by --record')
+    parser.add_argument('--limit', type=int, default=number_of_trains)
+    parser.add_argument('--no-render', action='store_true', help='only parse')
+    args = parser.parse_args()
+
+    player = replay.Player(args.log)
+    clock = replay.SteppedClock(player.start)
+    timeparse.set_clock(clock)
+    transport.player = player
+    renderer = None if args.no_render else ImageRenderer(NullTarget())
+
+    stations = {}
+    refreshes, frames = [], []
+    start = time.perf_counter()
+    for t, endpoint, path in player.records:
+        if endpoint != 'departures':
+            continue  # Services are looked up by the refreshes
+        clock.advance_to(t)
+        station_code = path.rsplit('/', 1)[1]
+        d = stations.get(station_code)
+        if d is None:
+            d = stations[station_code] = api.Departures(station_code, limit=args.limit)
+
+        began = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            d.refresh()
+        refreshes.append(time.perf_counter() - began)
+
+        if renderer is not None:
+            began = time.perf_counter()
+            renderer.set_station(d.name)
+            renderer.set_time(clock.now().strftime('%H:%M:%S'))
+            renderer.show_trains(pad_trains(d.snapshot.trains, api.STOCK_TRAIN))
+            renderer.flush()
+            frames.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - start
+
+    span = player.end - player.start
+    print(f'{len(player.records)} responses, {len(refreshes)} refreshes of {len(stations)} stations')
+    print(f'replayed {span / 60:.1f} min in {elapsed:.1f}s ({span / elapsed if elapsed else 0:.0f}x)')
+    if refreshes:
+        print(f'refresh mean {statistics.mean(refreshes) * 1000:.2f}ms, max {max(refreshes) * 1000:.2f}ms')
+    if frames:
+        print(f'frame   mean {statistics.mean(frames) * 1000:.2f}ms, max {max(frames) * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+'''
+Local stand-in for the GoTrain API, serving generated departures and services.
+
+    python -m bench.server --port 8080 --latency 50 --departures 60
+
+Also pushes departure updates as server-sent events on
+/v2/departures/stream?stations=UT,ASD
+'''
+import argparse
+import json
+import random
+import threading
+import time
+
+from datetime import datetime as dt, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from ns import stations
+
+
+MATERIAL = ['VIRM-4', 'VIRM-6', 'ICM-3', 'ICM-4', 'DDZ-4', 'DDZ-6', 'SLT-4', 'SLT-6',
+            'FLIRT-3', 'FLIRT-4', 'SNG-3', 'SNG-4', 'LINT-2', 'ICNG-5', 'ICNG-8', 'SGM-3']
+TYPES = ['IC', 'SPR', 'ICD', 'RE']
+
+
+class GoTrainStandIn:
+    '''
+    Generates realistic departure and service documents.
+    Departures of different stations share a pool of service numbers, like
+    stations on the same line do.
+    '''
+
+    def __init__(self, departures: int = 40, stops: int = 12, latency: float = 0,
+                 jitter: float = 0, service_pool: int = 400, seed: int = 0,
+                 push_interval: float = 2) -> None:
+        # Departures per station, stops per service
+        self.departures = departures
+        self.stops = stops
+        # Response latency in seconds, +- jitter
+        self.latency = latency
+        self.jitter = jitter
+        self.service_pool = service_pool
+        self.seed = seed
+        # Seconds between pushed updates on the event stream
+        self.push_interval = push_interval
+        self.requests = 0
+        self.bytes = 0
+        self._stations = {}
+        # Encoded documents, departures are regenerated every minute
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def _random(self, *key) -> random.Random:
+        return random.Random(f'{self.seed}:{":".join(map(str, key))}')
+
+    def _names(self):
+        return list(stations.codes.values())
+
+    def departures_document(self, station_code: str) -> dict:
+        station_code = station_code.upper()
+        now = dt.now(timezone.utc).replace(second=0, microsecond=0)
+        r = self._random(station_code)
+        names = self._names()
+        offset = r.randrange(self.service_pool)
+        service_date = now.strftime('%Y-%m-%d')
+
+        departures = []
+        for i in range(self.departures):
+            number = 1000 + (offset + i * 7) % self.service_pool
+            t = self._random(number)
+            departure_time = now + timedelta(minutes=2 + i * 3 // 2)
+            destination = names[t.randrange(len(names))]
+            changed = t.random() < 0.05
+            departures.append({
+                'id': f'{service_date}-{number}-{station_code}',
+                'service_date': service_date,
+                'service_number': str(number),
+                'service_id': str(number),
+                'company': 'NS',
+                'type': 'Intercity',
+                'type_code': TYPES[t.randrange(len(TYPES))],
+                'line_number': None if t.random() < 0.5 else f'{t.randrange(1, 40)}',
+                'station': station_code,
+                'departure_time': departure_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'delay': 60 * t.choice([0, 0, 0, 0, 1, 2, 5]),
+                'cancelled': t.random() < 0.02,
+                'destination_actual': destination,
+                'destination_planned': names[t.randrange(len(names))] if changed else destination,
+                'platform_actual': str(t.randrange(1, 20)),
+                'platform_planned': str(t.randrange(1, 20)),
+                'platform_changed': changed,
+                'via': [names[t.randrange(len(names))] for _ in range(2)],
+                'remarks': [],
+                'tips': [],
+                'wings': [],
+            })
+            with self._lock:
+                self._stations.setdefault(str(number), set()).add(station_code)
+        return {'departures': departures}
+
+    def service_document(self, service_number: str, service_date: str) -> dict:
+        r = self._random(service_number)
+        codes = list(stations.codes.keys())
+        with self._lock:
+            calling = sorted(self._stations.get(service_number, ()))
+        calling += [c.upper() for c in r.sample(codes, max(0, self.stops - len(calling)))]
+
+        material = [r.choice(MATERIAL)]
+        if r.random() < 0.3:
+            material.append(r.choice(MATERIAL))  # Double traction
+
+        stops = []
+        for code in calling:
+            stops.append({
+                'station': {'code': code, 'name': stations.codes.get(code.lower(), code)},
+                'arrival_platform': str(r.randrange(1, 20)),
+                'departure_platform': str(r.randrange(1, 20)),
+                'material': [{'type': m, 'number': str(r.randrange(8000, 9999)),
+                              'remains_behind': False} for m in material],
+            })
+        return {'service': {'service_number': service_number, 'service_date': service_date,
+                            'parts': [{'service_number': service_number, 'stops': stops}]}}
+
+    def updates(self, station_codes: list):
+        '''
+        Endless departure updates for the stations: a departure among the
+        next few gets more delay, a platform change or is cancelled.
+        '''
+        r = random.Random()
+        while True:
+            station_code = r.choice(station_codes).upper()
+            departure = dict(r.choice(self.departures_document(station_code)['departures'][:10]))
+            change = r.random()
+            if change < 0.6:
+                departure['delay'] += 60 * r.randrange(1, 5)
+            elif change < 0.9:
+                departure['platform_actual'] = str(r.randrange(1, 20))
+                departure['platform_changed'] = True
+            else:
+                departure['cancelled'] = True
+            yield {'station': station_code, 'departure': departure}
+
+    def route(self, path: str):
+        parts = path.strip('/').split('/')
+        if parts[:3] == ['v2', 'departures', 'station'] and len(parts) == 4:
+            return self.departures_document(parts[3])
+        if parts[:3] == ['v2', 'services', 'service'] and len(parts) == 5:
+            return self.service_document(parts[3], parts[4])
+        return None
+
+    def body(self, path: str):
+        '''
+        Encoded response for path, None if it is not found.
+        Generated documents are kept, so the stand-in stays out of the measurements.
+        '''
+        key = (path, int(time.time() // 60) if '/departures/' in path else None, self.departures, self.stops)
+        body = self._documents.get(key)
+        if body is None:
+            document = self.route(path)
+            if document is None:
+                return None
+            body = json.dumps(document).encode()
+            self._documents[key] = body
+        return body
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+
+def _handler(standin: GoTrainStandIn):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive
+        # Headers and body are written separately, avoid delayed ACK stalls
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _stream(self, station_codes: list):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            # No length, the stream ends with the connection
+            self.close_connection = True
+            self.wfile.write(b': connected\n\n')
+            self.wfile.flush()
+            for update in standin.updates(station_codes):
+                time.sleep(standin.push_interval)
+                self.wfile.write(f'event: departure\ndata: {json.dumps(update)}\n\n'.encode())
+                self.wfile.flush()
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == '/v2/departures/stream':
+                station_codes = parse_qs(url.query).get('stations', ['UT'])[0].split(',')
+                return self._stream(station_codes)
+
+            standin.delay()
+            body = standin.body(self.path)
+            found = body is not None
+            body = body or b''
+            with standin._lock:
+                standin.requests += 1
+                standin.bytes += len(body)
+
+            self.send_response(200 if found else 404)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that stop reading early drop the connection, that is expected
+        pass
+
+
+def serve(standin: GoTrainStandIn, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    '''
+    Start the stand-in on a daemon thread, port 0 picks a free port.
+    '''
+    server = _Server((host, port), _handler(standin))
+    threading.Thread(target=server.serve_forever, name='gotrain-standin', daemon=True).start()
+    return server
+
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local GoTrain stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='response latency in ms')
+    parser.add_argument('--jitter', type=float, default=0, help='latency jitter in ms')
+    parser.add_argument('--departures', type=int, default=40, help='departures per station')
+    parser.add_argument('--stops', type=int, default=12, help='stops per service')
+    parser.add_argument('--push-interval', type=float, default=2, help='seconds between pushed updates')
+    args = parser.parse_args()
+
+    standin = GoTrainStandIn(departures=args.departures, stops=args.stops,
+                             latency=args.latency / 1000, jitter=args.jitter / 1000,
+                             push_interval=args.push_interval)
+    server = serve(standin, args.host, args.port)
+    print(f'GoTrain stand-in on {base_url(server)}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,75 @@
+'''
+Departure time parsing: the fast path in ns/timeparse.py against strptime + pytz.
+
+    python -m bench.timeparse
+
+Checks both paths are equivalent for every minute around the DST transitions,
+then reports parses per second.
+'''
+import time
+
+from datetime import datetime as dt, timedelta, timezone
+
+import pytz
+
+from ns import timeparse
+
+
+PYTZ_UTC = pytz.utc
+PYTZ_LOCAL = pytz.timezone('Europe/Amsterdam')
+
+
+def reference(value: str):
+    # The original path in Departures._update_departures
+    time = dt.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
+    time = PYTZ_UTC.localize(time)
+    return time, time.astimezone(PYTZ_LOCAL).strftime("%H:%M")
+
+
+def fast(value: str):
+    time = timeparse.parse_utc(value)
+    return time, timeparse.display_time(time)
+
+
+def timestamps(start: dt, hours: int, step: timedelta = timedelta(seconds=37)):
+    t = start
+    while t < start + timedelta(hours=hours):
+        yield t.strftime('%Y-%m-%dT%H:%M:%SZ')
+        t += step
+
+
+def check_equivalence() -> int:
+    checked = 0
+    for year in range(2022, 2031):
+        for month in (3, 10):
+            # Last Sunday of March and October, transitions at 01:00 UTC
+            last = dt(year, month, 31, tzinfo=timezone.utc)
+            sunday = last - timedelta(days=(last.weekday() + 1) % 7)
+            for value in timestamps(sunday - timedelta(hours=6), 12):
+                expected, got = reference(value), fast(value)
+                assert expected == got, f'{value}: {expected} != {got}'
+                checked += 1
+    return checked
+
+
+def throughput(fn, values: list[str], rounds: int = 5) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for v in values:
+            fn(v)
+    return rounds * len(values) / (time.perf_counter() - start)
+
+
+def main():
+    print(f'Equivalent for {check_equivalence()} timestamps around DST transitions')
+
+    # A day of departures, every 30 seconds
+    values = list(timestamps(dt(2026, 10, 25, tzinfo=timezone.utc), 24, timedelta(seconds=30)))
+    old = throughput(reference, values)
+    new = throughput(fast, values)
+    print(f'strptime + pytz {old:>10.0f}/s')
+    print(f'timeparse       {new:>10.0f}/s ({new / old:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,54 @@
-import tkinter as tk
+import time
+_started = time.perf_counter()  # Cold start timing starts before the imports below
 
-from turtle import width
-from datetime import datetime as dt
+import tkinter as tk
 
+import argparse
+import resource
 from collections import deque
 
+# Only what the shell UI needs, the API and its dependencies are imported once it is drawn
 from ns import colours as c
-from ns import api as api
-from ns.stations import full_station_name
+from ns import metrics
+from ns import timeparse
+from ns.records import Train
+from ns.quiet import QuietHours
 
-import util
+import layout
+from layout import pi_width, pi_height, row_height, number_of_trains, train_cells
 
 import constants
 
 
-pi_width = 480
-pi_height = 320
-row_height = pi_height / 8
+# Seconds since the first line of board.py per start up phase
+startup = {}
+
+
+def _mark(phase: str):
+    startup.setdefault(phase, time.perf_counter() - _started)
+
+
+parser = argparse.ArgumentParser(description='NS departure board')
+parser.add_argument('--renderer', choices=['grid', 'canvas'],
+                    default=getattr(constants, 'board_renderer', 'grid'),
+                    help='grid of Tk widgets, or a single canvas')
+parser.add_argument('--profile', action='store_true',
+                    help='log frame time and memory of every redraw')
+parser.add_argument('--merged', action='store_true',
+                    default=getattr(constants, 'merged_board', False),
+                    help='merge all stations into one board by departure time')
+parser.add_argument('--metrics-port', type=int,
+                    default=getattr(constants, 'metrics_port', None),
+                    help='serve Prometheus metrics on localhost:<port>/metrics')
+parser.add_argument('--feed', default=getattr(constants, 'gotrain_feed_url', None),
+                    help='URL of a server-sent event stream of departure updates, polls only if unset')
+parser.add_argument('--store', default=getattr(constants, 'store_path', 'departures.sqlite'),
+                    help='SQLite file keeping the last departures across restarts, empty to disable')
+parser.add_argument('--record', metavar='LOG', help='record all API responses to a gzipped log')
+parser.add_argument('--replay', metavar='LOG', help='replay a recorded log instead of using the API')
+parser.add_argument('--speed', type=float, default=1, help='replay speed, e.g. 60 replays an hour per minute')
+args = parser.parse_args()
+_mark('imports')
 
 
 root = tk.Tk()
@@ -26,57 +58,16 @@ root.maxsize(width=pi_width, height=pi_height)
 # Make the window borderless
 root.overrideredirect(True)
 
-# Header
-
-# Define frame for header
-header_frame = tk.Frame(root, width=pi_width, height=row_height)
-header_frame.grid(row=0, column=0)
-
-# Force dimensions
-header_frame.grid_propagate(False)
-
-# Configure the grid so the widgets can expand
-header_frame.grid_columnconfigure(0, weight=1)
-header_frame.grid_columnconfigure(1, weight=0)
-header_frame.grid_rowconfigure(0, weight=1)
-
 # Header common styling
 header_text_args = {
-    'font': ('Frutiger', 20),
+    'font': ('Frutiger', layout.header_font_size),
     'fg': c.white,
     'bg': c.blue}
 
-
-station_label = tk.Label(header_frame,
-                         text="Test",  # station_codes[selected_station],
-                         anchor=tk.W,
-                         **header_text_args)
-# Position, and fill cell with sticky
-station_label.grid(row=0, column=0, sticky=tk.NSEW)
-
-time_label = tk.Label(header_frame,
-                      text="12:00:00",
-                      **header_text_args)
-
-time_label.grid(row=0, column=1, sticky=tk.NSEW)
-
-
-def update_time():
-    current_time = dt.now().strftime("%H:%M:%S")
-    time_label.config(text=current_time)
-    root.after(1000, update_time)
-
-
-update_time()
-
-
-# Trains
-number_of_trains = 7  # Limit to 7
-
 # Common styling
 train_style = {
     'anchor': tk.W,
-    'font': ('Frutiger', 16),
+    'font': ('Frutiger', layout.train_font_size),
     'fg': c.blue,
     'bg': c.white}
 delayed_style = train_style | {
@@ -85,111 +76,351 @@ track_style = train_style | {
     'anchor': tk.CENTER}
 
 
-def create_dark_frame():
-    # Define frame for trains
-    tf = tk.Frame(root, width=pi_width, height=pi_height -
-                  row_height, background='black')
-    tf.grid(row=1, column=0)
+class TrainRow:
+    '''
+    The widgets of a single train, created once and reused on every update.
+    Only cells whose text or colour changed are reconfigured.
+    '''
+
+    def __init__(self, frame: tk.Frame, n: int) -> None:
+        i = n*2
+        self.time = tk.Label(frame, **train_style)
+        self.time.grid(row=i, column=0, sticky=tk.NSEW)
+
+        self.delay = tk.Label(frame, **delayed_style)
+        self.delay.grid(row=i, column=1, sticky=tk.NSEW)
+        self.delay.grid_remove()  # Only shown when delayed
+
+        track_frame = tk.LabelFrame(
+            frame, text='spoor', highlightcolor=c.blue, highlightbackground=c.blue, background=c.white)
+        track_frame.grid(row=i, column=2, sticky=tk.NSEW)
+        self.track = tk.Label(track_frame, **track_style)
+        self.track.pack()
+
+        self.service = tk.Label(frame, **train_style)
+        self.service.grid(row=i, column=3, sticky=tk.NSEW)
+
+        rolling_stock_frame = tk.LabelFrame(
+            frame, text='Materieel', highlightcolor=c.blue, highlightbackground=c.blue, background=c.white)
+        rolling_stock_frame.grid(row=i, column=4, sticky=tk.NSEW)
+        self.rolling_stock = tk.Label(rolling_stock_frame, **track_style)
+        self.rolling_stock.pack()
+
+        tk.Frame(frame, background=c.blue).grid(
+            row=i+1, columnspan=5, sticky=tk.EW)
+
+        # Last rendered (text, colour) per cell
+        self._cells = {}
+        self._delayed = False
+
+    def _set(self, label: tk.Label, cell: tuple):
+        if self._cells.get(label) != cell:
+            text, fg = cell
+            label.config(text=text, fg=fg)
+            self._cells[label] = cell
+
+    def update(self, t: Train):
+        cells = train_cells(t)
+        self._set(self.time, cells['time'])
+        self._set(self.service, cells['service'])
+        self._set(self.track, cells['track'])
+        self._set(self.rolling_stock, cells['rolling_stock'])
+
+        delayed = t.delay > 0
+        if delayed:
+            self._set(self.delay, cells['delay'])
+        if delayed != self._delayed:
+            self._delayed = delayed
+            if delayed:
+                self.delay.grid()
+            else:
+                self.delay.grid_remove()
+
+
+class GridRenderer:
+    '''
+    Renders the board as a grid of Tk widgets.
+    '''
+
+    def __init__(self, root: tk.Tk) -> None:
+        # Define frame for header
+        header_frame = tk.Frame(root, width=pi_width, height=row_height)
+        header_frame.grid(row=0, column=0)
+
+        # Force dimensions
+        header_frame.grid_propagate(False)
+
+        # Configure the grid so the widgets can expand
+        header_frame.grid_columnconfigure(0, weight=1)
+        header_frame.grid_columnconfigure(1, weight=0)
+        header_frame.grid_rowconfigure(0, weight=1)
+
+        self.station_label = tk.Label(header_frame,
+                                      text="Test",  # station_codes[selected_station],
+                                      anchor=tk.W,
+                                      **header_text_args)
+        # Position, and fill cell with sticky
+        self.station_label.grid(row=0, column=0, sticky=tk.NSEW)
+
+        self.time_label = tk.Label(header_frame,
+                                   text="12:00:00",
+                                   **header_text_args)
+
+        self.time_label.grid(row=0, column=1, sticky=tk.NSEW)
+
+        self.train_frame = self._create_train_frame(root)
+        self.train_rows = [TrainRow(self.train_frame, n) for n in range(number_of_trains)]
+
+    def _create_train_frame(self, root: tk.Tk):
+        # Define frame for trains
+        tf = tk.Frame(root, width=pi_width, height=pi_height -
+                      row_height, background=c.white)
+        tf.grid(row=1, column=0)
+
+        # Force dimensions
+        tf.grid_propagate(False)
+
+        # Configure the grid so the widgets can expand
+        tf.grid_columnconfigure(0, weight=0)  # Time
+        tf.grid_columnconfigure(1, weight=0)  # Delay
+        tf.grid_columnconfigure(2, weight=0)  # Track
+        tf.grid_columnconfigure(3, weight=1)  # Service
+        tf.grid_columnconfigure(4, weight=0)  # Stock
+
+        for i in range(number_of_trains):
+            tf.grid_rowconfigure(i*2, weight=1)  # Train
+            tf.grid_rowconfigure(i*2+1, weight=0)  # Seperator
+        return tf
+
+    def set_time(self, text: str):
+        self.time_label.config(text=text)
+
+    def set_station(self, text: str):
+        self.station_label.config(text=text)
+
+    def show_trains(self, trains: tuple):
+        self.train_frame.grid()
+        for row, t in zip(self.train_rows, trains):
+            row.update(t)
+
+    def hide_trains(self):
+        self.train_frame.grid_remove()
+
+
+class CanvasRenderer:
+    '''
+    Renders the board as items on a single canvas, updated in place with itemconfig.
+    '''
+
+    def __init__(self, root: tk.Tk) -> None:
+        self.canvas = tk.Canvas(root, width=pi_width, height=pi_height,
+                                background=c.white, highlightthickness=0, borderwidth=0)
+        self.canvas.grid(row=0, column=0)
+
+        # Header
+        self.canvas.create_rectangle(0, 0, pi_width, row_height, fill=c.blue, outline='')
+        header_font = header_text_args['font']
+        self.station_text = self.canvas.create_text(
+            4, row_height / 2, anchor=tk.W, text="Test", fill=c.white, font=header_font)
+        self.time_text = self.canvas.create_text(
+            pi_width - 4, row_height / 2, anchor=tk.E, text="12:00:00", fill=c.white, font=header_font)
+
+        # Trains, every item is tagged 'trains' so the body can be hidden at once
+        self.night = self.canvas.create_rectangle(
+            0, row_height, pi_width, pi_height, fill='black', outline='', state=tk.HIDDEN)
+        self.rows = [self._create_row(n) for n in range(number_of_trains)]
+        # Last rendered (text, colour) per item
+        self._items = {}
+
+    def _create_row(self, n: int) -> dict:
+        top = row_height * (n + 1)
+        middle = top + row_height / 2
+        font = train_style['font']
+        label_font = ('Frutiger', layout.box_label_font_size)
+
+        def text(x, anchor=tk.W):
+            return self.canvas.create_text(x, middle, anchor=anchor, text='',
+                                           fill=c.blue, font=font, tags='trains')
+
+        def box(x0, x1, label):
+            # Mimics a LabelFrame: a small caption above the value
+            self.canvas.create_rectangle(x0, top + 2, x1, top + row_height - 3,
+                                         outline=c.blue, tags='trains')
+            self.canvas.create_text(x0 + 3, top + 8, anchor=tk.W, text=label,
+                                    fill=c.blue, font=label_font, tags='trains')
+            item = text((x0 + x1) / 2, tk.CENTER)
+            self.canvas.move(item, 0, 4)
+            return item
+
+        row = {
+            'time': text(layout.time_x),
+            'delay': text(layout.delay_x),
+            'track': box(layout.track_x, layout.service_x - 6, 'spoor'),
+            'service': text(layout.service_x),
+            'rolling_stock': box(layout.stock_x, pi_width - 4, 'Materieel'),
+        }
+        # Seperator
+        self.canvas.create_line(0, top + row_height - 1, pi_width, top + row_height - 1,
+                                fill=c.blue, tags='trains')
+        return row
+
+    def _set(self, item: int, cell: tuple):
+        if self._items.get(item) != cell:
+            text, fill = cell
+            self.canvas.itemconfig(item, text=text, fill=fill)
+            self._items[item] = cell
+
+    def set_time(self, text: str):
+        self.canvas.itemconfig(self.time_text, text=text)
+
+    def set_station(self, text: str):
+        self.canvas.itemconfig(self.station_text, text=text)
+
+    def show_trains(self, trains: tuple):
+        self.canvas.itemconfig(self.night, state=tk.HIDDEN)
+        self.canvas.itemconfig('trains', state=tk.NORMAL)
+        for row, t in zip(self.rows, trains):
+            for key, cell in train_cells(t).items():
+                self._set(row[key], cell)
+
+    def hide_trains(self):
+        self.canvas.itemconfig('trains', state=tk.HIDDEN)
+        self.canvas.itemconfig(self.night, state=tk.NORMAL)
+
+
+renderers = {
+    'grid': GridRenderer,
+    'canvas': CanvasRenderer,
+}
+renderer = renderers[args.renderer](root)
+
+
+def update_time():
+    current_time = timeparse.clock.now().strftime("%H:%M:%S")
+    renderer.set_time(current_time)
+    root.after(1000, update_time)
 
-    # Force dimensions
-    tf.grid_propagate(False)
-    return tf
 
+update_time()
+
+# Put the empty board on screen before loading the API
+root.update()
+_mark('tk')
 
-def create_train_frame():
-    # Define frame for trains
-    tf = tk.Frame(root, width=pi_width, height=pi_height -
-                  row_height, background=c.white)
-    tf.grid(row=1, column=0)
+from ns import api, cache, replay, store
+from ns.feed import Feed
+from ns.merge import MergedBoard
+from ns.scheduler import Scheduler
+_mark('api')
 
-    # Force dimensions
-    tf.grid_propagate(False)
 
-    # Configure the grid so the widgets can expand
-    tf.grid_columnconfigure(0, weight=0)  # Time
-    tf.grid_columnconfigure(1, weight=0)  # Delay
-    tf.grid_columnconfigure(2, weight=0)  # Track
-    tf.grid_columnconfigure(3, weight=1)  # Service
-    tf.grid_columnconfigure(4, weight=0)  # Stock
+def report_startup():
+    # Time spent per phase, the first frame with fetched departures ends the cold start
+    previous = 0
+    phases = []
+    for phase, seconds in startup.items():
+        phases.append(f'{phase} {(seconds - previous) * 1000:.0f}ms')
+        previous = seconds
+    print(f'Cold start {previous * 1000:.0f}ms: {", ".join(phases)}')
 
-    for i in range(number_of_trains):
-        tf.grid_rowconfigure(i, weight=1)
-    return tf
 
+if args.metrics_port:
+    metrics.serve(args.metrics_port)
 
-train_frame = create_train_frame()
+# Station and trains currently on the board
+rendered = None
 
-live_departures = deque(map(lambda x: api.Departures(
+station_departures = list(map(lambda x: api.Departures(
     station_code=x, limit=number_of_trains, destination_filter=['ES']), constants.ns_stations))
 
+if args.replay:
+    # Recorded traffic on its own clock, nothing is fetched or stored
+    replay.replay(args.replay, args.speed)
+    args.store = args.feed = None
+elif args.record:
+    replay.record(args.record)
+
+if args.store:
+    # First frame shows the departures of the last run, marked stale
+    store.open_store(args.store)
+    store.restore(station_departures, cache.compositions)
+
+if args.merged:
+    # One chronological board for all stations instead of rotating
+    live_departures = deque([MergedBoard(station_departures, limit=number_of_trains,
+                                         name=getattr(constants, 'merged_board_name', ''))])
+else:
+    live_departures = deque(station_departures)
+
+# Offline window, followed by the scheduler as well
+quiet_hours = QuietHours.from_constants()
+
+# A single scheduler refreshes all stations, in the order they are shown
+scheduler = Scheduler(quiet=quiet_hours)
+for departures in station_departures:
+    scheduler.register(departures)
+scheduler.prioritise(live_departures[0])
+scheduler.start()
+
+# Pushed updates, the scheduler polls again whenever the feed drops
+feed = None
+if args.feed:
+    feed = Feed(args.feed, station_departures, scheduler)
+    feed.start()
+
 
 def update_board():
-    global train_frame
-    # Suspend API calls between 0 and 5
-    h = dt.now().hour
-    if h >= 0 and h < 5:
-        station_label.config(text="Offline till 5:00")
-        train_frame.destroy()
+    global rendered
+    # Board is offline during quiet hours, the scheduler stops polling
+    if quiet_hours.is_quiet(timeparse.clock.now()):
+        renderer.set_station(quiet_hours.label())
+        renderer.hide_trains()
+        rendered = None
     else:
         global live_departures
         board = live_departures[0]  # Select current station
-        station_label.config(text=full_station_name(board.station_code))
-        trains = board.get_trains()
-        live_departures.rotate(-1)  # Cycles through stations
-
-        # Fill the board with empty entries if api returned < 7
-        for i in range(7 - len(trains)):
-            trains.append(api.STOCK_TRAIN)
-
-        # Destroy the old frame, and rebuild frame
-        train_frame.destroy()
-        del(train_frame)
-        train_frame = create_train_frame()
-
-        # Fill the frame with train data
-        for n in range(number_of_trains):
-            i = n*2
-            train_frame.grid_rowconfigure(i, weight=1)  # Train
-
-            t = trains[n]
-
-            if not t['cancelled']:
-                tk.Label(train_frame, text=t['time'], **train_style)\
-                    .grid(row=i, column=0, sticky=tk.NSEW)
-            else:
-                tk.Label(train_frame, text=util.strike(t['time']), **delayed_style)\
-                    .grid(row=i, column=0, sticky=tk.NSEW)
-
-            delay = t['delay']
-            if (delay > 0):
-                tk.Label(train_frame, text='+{}'.format(delay), **delayed_style)\
-                    .grid(row=i, column=1, sticky=tk.NSEW)
-
-            track_frame = tk.LabelFrame(
-                train_frame, text='spoor', highlightcolor=c.blue, highlightbackground=c.blue, background=c.white)
-            track_frame.grid(row=i, column=2, sticky=tk.NSEW)
-            tk.Label(track_frame, text=t['platform'], **track_style).pack()
-
-            service_text = t['service']
-            if not t['cancelled']:
-                tk.Label(train_frame, text=service_text, **train_style)\
-                    .grid(row=i, column=3, sticky=tk.NSEW)
-            else:
-                tk.Label(train_frame, text=util.strike(service_text), **delayed_style)\
-                    .grid(row=i, column=3, sticky=tk.NSEW)
-
-            rolling_stock_frame = tk.LabelFrame(
-                train_frame, text='Materieel', highlightcolor=c.blue, highlightbackground=c.blue, background=c.white)
-            rolling_stock_frame.grid(row=i, column=4, sticky=tk.NSEW)
-            tk.Label(rolling_stock_frame,
-                     text=t['rolling_stock'], **track_style).pack()
-
-            train_frame.grid_rowconfigure(i+1, weight=0)  # Seperator
-            tk.Frame(train_frame, background=c.blue).grid(
-                row=i+1, columnspan=5, sticky=tk.EW)
+        # Read before the snapshot, a completed fetch has committed its snapshot
+        fetched = board.fetched
+        snapshot = board.snapshot
+        # Stay on the first station until it was fetched, and show it as soon as it is
+        waiting = fetched is None and 'first data' not in startup and time.perf_counter() - _started < 30
+        if waiting and not snapshot.version:
+            renderer.set_station(board.name)
+            root.after(200, update_board)
+            return
+        if not waiting:
+            live_departures.rotate(-1)  # Cycles through stations
+            scheduler.prioritise(live_departures[0])  # Shown next
+
+        # Skip redrawing when nothing changed
+        if rendered != (board.station_code, snapshot.version):
+            trains = layout.pad_trains(snapshot.trains, api.STOCK_TRAIN)
+
+            start = time.perf_counter()
+            renderer.set_station(board.name)
+            renderer.show_trains(trains)
+            rendered = (board.station_code, snapshot.version)
+            metrics.render_seconds.observe(time.perf_counter() - start, args.renderer)
+
+            if args.profile:
+                root.update_idletasks()  # Include Tk's own layout and drawing
+                frame_time = (time.perf_counter() - start) * 1000
+                max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                print(f'[{args.renderer}] frame {frame_time:.1f}ms, max RSS {max_rss}kB')
+
+        # The first fetch ends the cold start, also when it had no trains
+        if 'first data' not in startup and fetched is not None:
+            root.update_idletasks()
+            _mark('first data')
+            report_startup()
+
+        if waiting:
+            # Restored rows are on screen until the fetch replaces them
+            root.after(200, update_board)
+            return
 
     # Repeat API call after 30 seconds
-    root.after(1000*15, update_board)
+    root.after(int(1000*15 / timeparse.clock.speed), update_board)
 
 
 update_board()
@@ -197,6 +428,11 @@ update_board()
 
 # Add close button to esc
 def close_app(event):
+    if feed is not None:
+        feed.stop()
+    scheduler.stop()
+    store.close()
+    replay.close()
     root.destroy()
 
 
@@ -1,37 +1,248 @@
-import tkinter as tk
-from PIL import ImageTk, Image
+'''
+Full screen clock.
+
+    python clock.py            # cached background, only changed digits are redrawn
+    python clock.py --legacy   # one text item over the decoded JPEG
+    python clock.py --profile  # log CPU time per tick, for either mode
+'''
+import argparse
+import json
+import os
+import subprocess
 import time
+import tkinter as tk
+
+
+width = 480
+height = 320
+font_family = 'Frutiger'
+font_size = 72  # Points
+
+background_path = 'assets/background.jpg'
+cache_dir = 'assets/.cache'
+
+# Digits each position in %H%M%S can show, the colons are part of the background
+cell_digits = ('012', '0123456789', '012345', '0123456789', '012345', '0123456789')
+digit_cells = len(cell_digits)
+# Milliseconds past the wall clock second a tick is scheduled at
+tick_offset = 5
+
+
+def _cell_layout(font) -> dict:
+    # Every digit gets a cell as wide as the widest digit, so nothing shifts
+    digit_width = max(font.getlength(d) for d in '0123456789')
+    colon_width = font.getlength(':')
+    left = (width - 6 * digit_width - 2 * colon_width) / 2
+    cells, colons = [], []
+    x = left
+    for n in range(digit_cells):
+        cells.append(round(x))
+        x += digit_width
+        if n in (1, 3):
+            colons.append(x + colon_width / 2)
+            x += colon_width
+    left, top, right, bottom = font.getbbox('0123456789:', anchor='mm')
+    return {
+        'cells': cells,
+        'cell_width': round(digit_width) + 1,
+        'colons': colons,
+        'top': round(height / 2 + top) - 1,
+        'band_height': round(bottom - top) + 2,
+    }
+
+
+def font_file(family: str):
+    # The file fontconfig matches for the family, the same face Tk draws with
+    try:
+        result = subprocess.run(['fc-match', '--format=%{file}', family],
+                                capture_output=True, text=True, check=True)
+        return result.stdout or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_sheet(font_path, font_pixels: int, sheet_path: str, layout_path: str) -> dict:
+    '''
+    Decode and scale the background once, and pre-rasterise the digits on it.
+
+    The sheet is the background with the colons drawn in, above a single row
+    strip of glyphs: for every cell only the digits it can show, each on its
+    own piece of the background. Saved as PNG, which Tk loads without PIL.
+    '''
+    from PIL import Image, ImageDraw, ImageFont
+
+    if font_path is None:
+        font = ImageFont.load_default(font_pixels)
+    else:
+        font = ImageFont.truetype(font_path, font_pixels)
+    layout = _cell_layout(font)
+    top, band_height, cell_width = layout['top'], layout['band_height'], layout['cell_width']
+
+    background = Image.open(background_path).convert('RGB')
+    if background.size != (width, height):
+        background = background.resize((width, height), Image.LANCZOS)
+    draw = ImageDraw.Draw(background)
+    for x in layout['colons']:
+        draw.text((x, height / 2), ':', fill='white', font=font, anchor='mm')
+
+    glyphs = []
+    layout['strip'] = []
+    for x, digits in zip(layout['cells'], cell_digits):
+        # Strip x of the cell's first digit, the others follow
+        layout['strip'].append(len(glyphs) * cell_width)
+        for digit in digits:
+            glyph = background.crop((x, top, x + cell_width, top + band_height))
+            ImageDraw.Draw(glyph).text((cell_width / 2, height / 2 - top), digit,
+                                       fill='white', font=font, anchor='mm')
+            glyphs.append(glyph)
+
+    sheet = Image.new('RGB', (max(width, len(glyphs) * cell_width), height + band_height))
+    sheet.paste(background, (0, 0))
+    for n, glyph in enumerate(glyphs):
+        sheet.paste(glyph, (n * cell_width, height))
+
+    # Found once, a restart reuses the file instead of asking fontconfig again
+    layout['font'] = font_path
+    os.makedirs(cache_dir, exist_ok=True)
+    sheet.save(f'{sheet_path}.tmp', format='PNG', optimize=True)
+    os.replace(f'{sheet_path}.tmp', sheet_path)
+    with open(layout_path, 'w') as f:
+        json.dump(layout, f)
+    return layout
+
+
+def load_sheet(font_pixels: int):
+    '''
+    (sheet path, layout) of the cached sheet, built on first use. Rebuilt
+    when the background or the font file it was built with is newer, or gone.
+    '''
+    name = f'clock-{width}x{height}-{font_pixels}px-{font_family.replace(" ", "_")}'
+    sheet_path = os.path.join(cache_dir, f'{name}.png')
+    layout_path = os.path.join(cache_dir, f'{name}.json')
+    if os.path.exists(layout_path) and os.path.exists(sheet_path):
+        with open(layout_path) as f:
+            layout = json.load(f)
+        built = os.path.getmtime(layout_path)
+        sources = [background_path] + ([layout['font']] if layout['font'] else [])
+        if all(os.path.exists(p) and os.path.getmtime(p) <= built for p in sources):
+            return sheet_path, layout
+    return sheet_path, build_sheet(font_file(font_family), font_pixels, sheet_path, layout_path)
+
+
+class SheetClock:
+    '''
+    The background and every digit come from one pre-rendered sheet. A tick
+    swaps the image of the digit cells that changed, Tk only redraws those.
+    '''
+
+    def __init__(self, root: tk.Tk, canvas: tk.Canvas) -> None:
+        self.root = root
+        self.canvas = canvas
+        sheet_path, layout = load_sheet(round(root.winfo_fpixels(f'{font_size}p')))
+        sheet = tk.PhotoImage(file=sheet_path)
+        self.background = tk.PhotoImage(width=width, height=height)
+        self.background.tk.call(self.background, 'copy', sheet, '-from', 0, 0, width, height)
+        canvas.create_image(0, 0, anchor='nw', image=self.background)
+
+        top, band_height, cell_width = layout['top'], layout['band_height'], layout['cell_width']
+        # glyphs[cell][digit], cut from the strip below the background
+        self.glyphs = []
+        for start, digits in zip(layout['strip'], cell_digits):
+            glyphs = {}
+            for n, digit in enumerate(digits):
+                glyph = tk.PhotoImage(width=cell_width, height=band_height)
+                x = start + n * cell_width
+                glyph.tk.call(glyph, 'copy', sheet, '-from', x, height, x + cell_width, height + band_height)
+                glyphs[digit] = glyph
+            self.glyphs.append(glyphs)
+        self.items = [canvas.create_image(x, top, anchor='nw') for x in layout['cells']]
+        self.shown = [None] * digit_cells
+
+    def show(self, now: float):
+        for n, digit in enumerate(time.strftime('%H%M%S', time.localtime(now))):
+            if digit != self.shown[n]:
+                self.canvas.itemconfig(self.items[n], image=self.glyphs[n][digit])
+                self.shown[n] = digit
+
+
+class TextClock:
+    '''
+    The original clock, a single text item over the decoded JPEG.
+    '''
+
+    def __init__(self, root: tk.Tk, canvas: tk.Canvas) -> None:
+        from PIL import ImageTk, Image
+
+        self.canvas = canvas
+        self.img = ImageTk.PhotoImage(Image.open(background_path))
+        canvas.create_image(0, 0, anchor="nw", image=self.img)
+        root.update()  # Forces style update to propagate
+        self.text = canvas.create_text(canvas.winfo_width() / 2,
+                                       canvas.winfo_height() / 2,
+                                       text="00:00:00",
+                                       fill="white",
+                                       font=(font_family, font_size))
+
+    def show(self, now: float):
+        self.canvas.itemconfig(self.text, text=time.strftime("%H:%M:%S", time.localtime(now)))
+
+
+class TickProfile:
+    '''
+    CPU time of the process per tick, including Tk's redraw after the tick.
+    '''
+
+    def __init__(self, label: str, every: int = 60) -> None:
+        self.label = label
+        self.every = every
+        self.ticks = 0
+        self.start = time.process_time()
 
-root = tk.Tk()
-root.overrideredirect(True)  # This removes the window border
+    def tick(self):
+        self.ticks += 1
+        if self.ticks == self.every:
+            cpu = (time.process_time() - self.start) / self.ticks * 1000
+            print(f'[{self.label}] {cpu:.2f}ms CPU per tick')
+            self.ticks = 0
+            self.start = time.process_time()
 
-canvas = tk.Canvas(root, width=480, height=320)
-canvas.pack()
 
-img = ImageTk.PhotoImage(Image.open("assets/background.jpg"))
-canvas.create_image(0, 0, anchor="nw", image=img)
-root.update()  # Forces style update to propagate
+def main():
+    parser = argparse.ArgumentParser(description='Full screen clock')
+    parser.add_argument('--legacy', action='store_true',
+                        help='redraw the whole text over the JPEG every second')
+    parser.add_argument('--profile', action='store_true', help='log CPU time per tick')
+    args = parser.parse_args()
 
+    root = tk.Tk()
+    root.overrideredirect(True)  # This removes the window border
 
-def update_time():
-    current_time = time.strftime("%H:%M:%S")
-    canvas.itemconfig(text, text=current_time)
-    root.after(1000, update_time)
+    if args.legacy:
+        canvas = tk.Canvas(root, width=width, height=height)
+    else:
+        canvas = tk.Canvas(root, width=width, height=height, highlightthickness=0, borderwidth=0)
+    canvas.pack()
 
+    clock = (TextClock if args.legacy else SheetClock)(root, canvas)
+    profile = TickProfile('legacy' if args.legacy else 'sheet') if args.profile else None
 
-text = canvas.create_text(canvas.winfo_width() / 2,
-                          canvas.winfo_height() / 2,
-                          text="00:00:00",
-                          fill="white",
-                          font=("Frutiger", 72))
-update_time()
+    def update_time():
+        now = time.time()
+        clock.show(now)
+        if profile is not None:
+            profile.tick()
+        # Aligned to the wall clock second, after() alone drifts
+        root.after(int((1 - now % 1) * 1000) + tick_offset, update_time)
 
+    update_time()
 
-def close_app(event):
-    root.destroy()
+    def close_app(event):
+        root.destroy()
 
+    root.bind('<Escape>', close_app)
 
-root.bind('<Escape>', close_app)
+    root.mainloop()
 
 
-root.mainloop()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+'''
+Headless departure board, drawn with PIL straight into an image buffer.
+Needs no X server or Tk.
+
+    python headless.py --output /dev/fb1
+    python headless.py --output board.png
+'''
+import argparse
+import os
+import time
+
+from collections import deque
+from datetime import datetime as dt
+
+from PIL import Image, ImageChops, ImageDraw
+
+import layout
+from util import load_font
+from layout import pi_width, pi_height, row_height, number_of_trains, train_cells
+
+from ns import colours as c
+from ns import api as api
+from ns import cache, metrics, store
+from ns.feed import Feed
+from ns.quiet import QuietHours
+from ns.scheduler import Scheduler
+
+import constants
+
+
+STRIKE = '\u0336'
+
+
+def _rgb565(image: Image.Image) -> bytes:
+    # Little endian RGB565, the usual format of small SPI panels
+    r, g, b = image.split()
+    high = ImageChops.add(r.point(lambda v: v & 0xF8), g.point(lambda v: v >> 5))
+    low = ImageChops.add(g.point(lambda v: (v << 3) & 0xE0), b.point(lambda v: v >> 3))
+    return Image.merge('LA', (low, high)).tobytes()
+
+
+class FramebufferTarget:
+    '''
+    Writes bands of the image to a Linux framebuffer device, e.g. /dev/fb1.
+    '''
+
+    def __init__(self, path: str) -> None:
+        name = os.path.basename(path)
+        sys_path = f'/sys/class/graphics/{name}'
+        with open(f'{sys_path}/bits_per_pixel') as f:
+            self.bits_per_pixel = int(f.read())
+        with open(f'{sys_path}/stride') as f:
+            self.stride = int(f.read())
+        if self.bits_per_pixel not in (16, 32):
+            raise ValueError(f'{path}: unsupported {self.bits_per_pixel} bits per pixel')
+        self.fb = open(path, 'r+b', buffering=0)
+
+    def _encode(self, image: Image.Image) -> bytes:
+        if self.bits_per_pixel == 16:
+            return _rgb565(image)
+        return image.tobytes('raw', 'BGRX')
+
+    def write(self, image: Image.Image, bands: list):
+        row_bytes = pi_width * self.bits_per_pixel // 8
+        for top, bottom in bands:
+            data = self._encode(image.crop((0, top, pi_width, bottom)))
+            for y in range(top, bottom):
+                offset = (y - top) * row_bytes
+                self.fb.seek(y * self.stride)
+                self.fb.write(data[offset:offset + row_bytes])
+
+
+class PngTarget:
+    '''
+    Saves the whole image as a PNG, replaced atomically.
+    '''
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def write(self, image: Image.Image, bands: list):
+        tmp = f'{self.path}.tmp'
+        image.save(tmp, format='PNG')
+        os.replace(tmp, self.path)
+
+
+class ImageRenderer:
+    '''
+    Draws the board layout with PIL. Only the header and the rows that
+    changed are re-rasterised, and only those bands are written out.
+    '''
+
+    def __init__(self, target) -> None:
+        self.target = target
+        self.image = Image.new('RGB', (pi_width, pi_height), c.white)
+        self.draw = ImageDraw.Draw(self.image)
+        self.header_font = load_font(layout.header_font_size)
+        self.train_font = load_font(layout.train_font_size)
+        self.label_font = load_font(layout.box_label_font_size + 2)
+
+        self.station = ''
+        self.time = ''
+        self._rows = [None] * number_of_trains
+        self._dark = False
+        self._dirty = []
+        self._draw_header()
+
+    def _band(self, n: int):
+        # Pixel rows of header (n = -1) or train n
+        top = int(row_height * (n + 1))
+        return top, int(row_height * (n + 2))
+
+    def _text(self, xy, text: str, fill: str, font, anchor: str = 'lm'):
+        struck = STRIKE in text
+        text = text.replace(STRIKE, '')
+        self.draw.text(xy, text, fill=fill, font=font, anchor=anchor)
+        if struck and text:
+            left, top, right, bottom = self.draw.textbbox(xy, text, font=font, anchor=anchor)
+            middle = (top + bottom) // 2
+            self.draw.line((left, middle, right, middle), fill=fill, width=2)
+
+    def _draw_header(self):
+        top, bottom = self._band(-1)
+        middle = (top + bottom) // 2
+        self.draw.rectangle((0, top, pi_width, bottom - 1), fill=c.blue)
+        self._text((4, middle), self.station, c.white, self.header_font)
+        self._text((pi_width - 4, middle), self.time, c.white, self.header_font, 'rm')
+        self._dirty.append((top, bottom))
+
+    def _draw_row(self, n: int, cells: dict):
+        top, bottom = self._band(n)
+        middle = (top + bottom) // 2
+        self.draw.rectangle((0, top, pi_width, bottom - 1), fill=c.white)
+
+        def box(x0, x1, label, cell):
+            self.draw.rectangle((x0, top + 2, x1, bottom - 3), outline=c.blue)
+            self.draw.text((x0 + 3, top + 3), label, fill=c.blue, font=self.label_font)
+            self._text(((x0 + x1) // 2, middle + 4), cell[0], cell[1], self.train_font, 'mm')
+
+        self._text((layout.time_x, middle), *cells['time'], self.train_font)
+        self._text((layout.delay_x, middle), *cells['delay'], self.train_font)
+        box(layout.track_x, layout.service_x - 6, 'spoor', cells['track'])
+        self._text((layout.service_x, middle), *cells['service'], self.train_font)
+        box(layout.stock_x, pi_width - 4, 'Materieel', cells['rolling_stock'])
+        # Seperator
+        self.draw.line((0, bottom - 1, pi_width, bottom - 1), fill=c.blue)
+        self._dirty.append((top, bottom))
+
+    def set_time(self, text: str):
+        if text != self.time:
+            self.time = text
+            self._draw_header()
+
+    def set_station(self, text: str):
+        if text != self.station:
+            self.station = text
+            self._draw_header()
+
+    def show_trains(self, trains: tuple):
+        if self._dark:
+            self._dark = False
+            self._rows = [None] * number_of_trains
+        for n, t in enumerate(trains):
+            cells = train_cells(t)
+            if cells != self._rows[n]:
+                self._draw_row(n, cells)
+                self._rows[n] = cells
+
+    def hide_trains(self):
+        if not self._dark:
+            self._dark = True
+            top = self._band(0)[0]
+            self.draw.rectangle((0, top, pi_width, pi_height), fill='black')
+            self._dirty.append((top, pi_height))
+
+    def flush(self):
+        '''
+        Write the changed bands to the target.
+        '''
+        if self._dirty:
+            bands, self._dirty = self._dirty, []
+            self.target.write(self.image, sorted(set(bands)))
+
+
+def create_target(path: str):
+    if path.startswith('/dev/fb'):
+        return FramebufferTarget(path)
+    return PngTarget(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless NS departure board')
+    parser.add_argument('--output', default=getattr(constants, 'headless_output', '/dev/fb1'),
+                        help='framebuffer device (/dev/fb*) or PNG file')
+    parser.add_argument('--rotate', type=float, default=15, help='seconds per station')
+    parser.add_argument('--metrics-port', type=int,
+                        default=getattr(constants, 'metrics_port', None),
+                        help='serve Prometheus metrics on localhost:<port>/metrics')
+    parser.add_argument('--feed', default=getattr(constants, 'gotrain_feed_url', None),
+                        help='URL of a server-sent event stream of departure updates, polls only if unset')
+    parser.add_argument('--store', default=getattr(constants, 'store_path', 'departures.sqlite'),
+                        help='SQLite file keeping the last departures across restarts, empty to disable')
+    args = parser.parse_args()
+
+    renderer = ImageRenderer(create_target(args.output))
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    live_departures = deque(map(lambda x: api.Departures(
+        station_code=x, limit=number_of_trains, destination_filter=['ES']), constants.ns_stations))
+    if args.store:
+        # First frame shows the departures of the last run, marked stale
+        store.open_store(args.store)
+        store.restore(live_departures, cache.compositions)
+
+    quiet_hours = QuietHours.from_constants()
+    scheduler = Scheduler(quiet=quiet_hours)
+    for departures in live_departures:
+        scheduler.register(departures)
+    scheduler.prioritise(live_departures[0])
+    scheduler.start()
+
+    # Pushed updates, the scheduler polls again whenever the feed drops
+    feed = None
+    if args.feed:
+        feed = Feed(args.feed, live_departures, scheduler)
+        feed.start()
+
+    rendered = None
+    next_rotation = 0
+    try:
+        while True:
+            now = time.monotonic()
+            renderer.set_time(dt.now().strftime("%H:%M:%S"))
+
+            if now >= next_rotation:
+                next_rotation = now + args.rotate
+                if quiet_hours.is_quiet(dt.now()):
+                    renderer.set_station(quiet_hours.label())
+                    renderer.hide_trains()
+                    rendered = None
+                else:
+                    board = live_departures[0]  # Select current station
+                    snapshot = board.snapshot
+                    live_departures.rotate(-1)  # Cycles through stations
+                    scheduler.prioritise(live_departures[0])  # Shown next
+
+                    # Skip redrawing when nothing changed
+                    if rendered != (board.station_code, snapshot.version):
+                        start = time.perf_counter()
+                        renderer.set_station(board.name)
+                        renderer.show_trains(layout.pad_trains(snapshot.trains, api.STOCK_TRAIN))
+                        rendered = (board.station_code, snapshot.version)
+                        metrics.render_seconds.observe(time.perf_counter() - start, 'headless')
+
+            renderer.flush()
+            # Wake up on the next wall clock second
+            time.sleep(1 - time.time() % 1)
+    except KeyboardInterrupt:
+        if feed is not None:
+            feed.stop()
+        scheduler.stop()
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+from ns import colours as c
+from ns import rollingstock
+from ns.records import Train
+
+import util
+
+
+pi_width = 480
+pi_height = 320
+row_height = pi_height / 8
+
+# Trains
+number_of_trains = 7  # Limit to 7
+
+# Left edge of every column, for renderers that place cells themselves
+time_x = 4
+delay_x = 62
+track_x = 100
+service_x = 156
+stock_x = 380
+
+# Font sizes in points
+header_font_size = 20
+train_font_size = 16
+box_label_font_size = 7
+
+
+def train_cells(t: Train):
+    '''
+    Text and colour of every cell of a train, shared by all renderers.
+    '''
+    if not t.cancelled:
+        # Stale trains from disk are muted until the first refresh
+        fg = c.light_blue if t.stale else c.blue
+        time_cell = (t.time, fg)
+        service_cell = (t.service, fg)
+    else:
+        time_cell = (util.strike(t.time), c.red)
+        service_cell = (util.strike(t.service), c.red)
+
+    delay = t.delay
+    delay_cell = ('+{}'.format(delay) if delay > 0 else '', c.red)
+
+    return {
+        'time': time_cell,
+        'delay': delay_cell,
+        'track': (t.platform, c.blue),
+        'service': service_cell,
+        'rolling_stock': (rollingstock.label(t.rolling_stock), c.blue),
+    }
+
+
+def pad_trains(trains: tuple, empty: Train = Train()) -> tuple:
+    # Fill the board with empty entries if api returned < 7
+    return trains + (empty,) * (number_of_trains - len(trains))
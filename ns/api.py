@@ -3,182 +3,388 @@ from typing import Tuple
 import threading
 import time
 
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime as dt, timedelta
-import pytz
-import requests
 import constants
 
-from ns import stations
+from ns import cache, cadence, jsonstream, metrics, rollingstock, station_index, store, timeparse, transport
+from ns.records import Snapshot, Train
+from ns.timeparse import UTC_TZ, LOCAL_TZ
+
+
+STOCK_TRAIN = Train()
+
+# Rolling stock lookups are fetched concurrently, shared by all stations
+COMPOSITION_WORKERS = 8
+# Seconds a refresh waits on rolling stock before leaving it unknown
+COMPOSITION_DEADLINE = 5
+
+_composition_pool = ThreadPoolExecutor(max_workers=COMPOSITION_WORKERS,
+                                       thread_name_prefix='composition')
+
+# Bytes read at once when streaming the departures document
+STREAM_CHUNK_SIZE = 8 * 1024
+
+# Departure fields that affect a parsed train, a change means re-parsing
+SIGNATURE_FIELDS = (
+    'departure_time', 'delay',
+    'platform_actual', 'platform_changed',
+    'line_number', 'type_code', 'destination_actual', 'destination_planned',
+    'service_date', 'cancelled',
+)
+
+# Service numbers added, removed and changed since the previous poll
+Diff = namedtuple('Diff', ['added', 'removed', 'changed'])
+
+
+class SingleFlight:
+    '''
+    Concurrent calls with the same key share one call, and its result or
+    exception. Nothing is kept once the call finished.
+    '''
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.shared = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                self.calls += 1
+                flight = self._flights[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            # Raises the exception of the call if it failed
+            return flight.result()
 
+        try:
+            result = fn(*args)
+            flight.set_result(result)
+            return result
+        except BaseException as e:
+            # Also on KeyboardInterrupt or SystemExit, or followers wait forever
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
 
-UTC_TZ = pytz.utc
-LOCAL_TZ = pytz.timezone('Europe/Amsterdam')
-STOCK_TRAIN = {
-    'cancelled': False,
+    def stats(self) -> dict:
+        with self._lock:
+            return {'calls': self.calls, 'shared': self.shared}
 
-    'time': '',
-    'delay': 0,
 
-    'platform_changed': False,
-    'platform': '',
+# Stations on the same line look up the same services at the same time
+_service_flights = SingleFlight()
 
-    'destination_changed': False,
-    'service': '',
+metrics.collector('gotrain_single_flight_total', 'Service lookups made, and shared with an identical one in flight',
+                  'counter', lambda: {(result,): n for result, n in _service_flights.stats().items()},
+                  ('result',))
 
-    'rolling_stock': '',
-}
 
+class _Entry:
+    # A parsed train in the snapshot of a station
+    __slots__ = ('signature', 'train', 'actual_time', 'service', 'resolved')
+
+    def __init__(self, signature: tuple, train: Train, actual_time: dt, service: Tuple[str, str],
+                 resolved: bool) -> None:
+        self.signature = signature
+        self.train = train
+        self.actual_time = actual_time
+        self.service = service
+        self.resolved = resolved
 
-class Departures:
-    trains = []
 
-    def __init__(self, station_code: str, limit: int = 10, destination_filter: list[str] = []) -> None:
+class Departures:
+    def __init__(self, station_code: str, limit: int = 10, destination_filter: list[str] = [],
+                 incremental: bool = True, streaming: bool = True) -> None:
         self.station_code = station_code.upper()
         self.limit = limit
-        self.destination_filter = [stations.full_station_name(x).lower() for x in destination_filter]
-        self.update_thread = threading.Thread(target=self._schedule)
-        self.update_thread.start()
-
-    def get_trains(self):
-        return self.trains.copy()
+        # Station codes, entries may be codes or (misspelled) names
+        self.destination_filter = {station_index.index().resolve(x) for x in destination_filter}
+        # Reuse parsed trains of services that did not change since the last poll
+        self.incremental = incremental
+        # Stream the departures document, stop reading once limit trains are accepted
+        self.streaming = streaming
+        self.snapshot = Snapshot()
+        self.diff = Diff([], [], [])
+        self._snapshot = {}
+        # Polls and pushed updates come from different threads
+        self._lock = threading.Lock()
+        # Seconds until the next poll, followed by the scheduler
+        self.cadence = cadence.Cadence.from_constants()
+        # Clock time the last fetch completed, None until the first, even if it had no trains
+        self.fetched = None
+
+    def clear(self):
+        # Drop the snapshot, the next refresh starts from scratch
+        with self._lock:
+            self.snapshot = Snapshot(self.snapshot.version + 1)
+            self.diff = Diff([], [], [])
+            self._snapshot = {}
+
+    def restore(self, trains: tuple):
+        # Show trains from disk until the first refresh replaces them
+        self.snapshot = Snapshot(self.snapshot.version + 1, trains)
+
+    @property
+    def name(self) -> str:
+        return station_index.index().name(self.station_code)
+
+    def get_trains(self) -> tuple:
+        # Immutable, no copy needed
+        return self.snapshot.trains
+
+    def get_diff(self) -> Diff:
+        return self.diff
 
     def _log(self, message: str):
-        print(f'[{dt.now(tz=LOCAL_TZ).strftime("%H:%M:%S")}] {message}')
-
-    def _schedule(self):
-        while True:
-            self._update_departures()
-            time.sleep(60)
-
-    def _update_departures(self):
+        print(f'[{timeparse.clock.now(LOCAL_TZ).strftime("%H:%M:%S")}] {message}')
+
+    def refresh(self, displayed: bool = False):
+        # Called by the scheduler, the station on screen goes ahead of other requests
+        with self._lock:
+            self._update_departures('display' if displayed else 'departures')
+
+    def apply_update(self, t: dict):
+        '''
+        Merge a single departure pushed by a Feed into the snapshot.
+        '''
+        with self._lock:
+            now = timeparse.clock.now(UTC_TZ)
+            service_number = t['service_number']
+            signature = tuple(t[f] for f in SIGNATURE_FIELDS)
+            previous = self._snapshot.get(service_number)
+            if previous is not None and previous.signature == signature:
+                return
+
+            snapshot = {s: e for s, e in self._snapshot.items()
+                        if s != service_number and now <= e.actual_time}
+            parsed = self._parse_train(t)
+            if parsed is not None and now <= parsed[1]:
+                entry = _Entry(signature, *parsed, resolved=False)
+                if previous is not None and previous.resolved:
+                    # Same service, the composition did not change
+                    entry.train = entry.train._replace(rolling_stock=previous.train.rolling_stock)
+                    entry.resolved = True
+                snapshot[service_number] = entry
+
+            # Keep the order of the departures document, by scheduled departure
+            ordered = sorted(snapshot.items(), key=lambda i: i[1].signature[0])[:self.limit]
+            snapshot = dict(ordered)
+            self._resolve_rolling_stock([e for e in snapshot.values() if not e.resolved])
+            self._commit(snapshot)
+
+    def _update_departures(self, lane: str = 'departures'):
         try:
             url = f'{constants.gotrain_api_base_url}/v2/departures/station/{self.station_code.upper()}'
-            response = requests.get(url=url)
-            trains = response.json()['departures']
+            response = transport.get(url, 'departures', lane, stream=self.streaming)
         except Exception as e:
             self._log(f'API Exception: {e}')
+            self.cadence.failed()
             return
 
-        now = dt.now(tz=UTC_TZ)
-        parsed_trains = []
+        start = time.perf_counter()
+        now = timeparse.clock.now(UTC_TZ)
+        try:
+            if self.streaming:
+                # Parse departures as they arrive, reading stops at the limit
+                trains = jsonstream.iter_array(response.iter_content(STREAM_CHUNK_SIZE), 'departures')
+            else:
+                trains = response.json()['departures']
+            snapshot, pending = self._accept_trains(trains, now)
+        except Exception as e:
+            self._log(f'API Exception: {e}')
+            self.cadence.failed()
+            return
+        finally:
+            # Drops the connection if the document was not read completely
+            response.close()
+
+        '''
+        Rolling stock processing
+        '''
+        self._resolve_rolling_stock(pending)
+        disruptions = cadence.disrupted({s: e.train for s, e in self._snapshot.items()},
+                                        {s: e.train for s, e in snapshot.items()})
+        version = self.snapshot.version
+        self._commit(snapshot)
+        self.fetched = timeparse.clock.monotonic()
+        interval = self.cadence.observe(disruptions, self.snapshot.version != version,
+                                        self.snapshot.trains, now.timestamp())
+
+        took = time.perf_counter() - start
+        metrics.refresh_seconds.observe(took, self.station_code)
+        self._log(
+            f'Fetched departures for {self.station_code}, took {took}s, next in {interval:.0f}s.')
+
+    def _commit(self, snapshot: dict):
+        self.diff = Diff(
+            added=[s for s in snapshot if s not in self._snapshot],
+            removed=[s for s in self._snapshot if s not in snapshot],
+            changed=[s for s, e in snapshot.items()
+                     if s in self._snapshot and self._snapshot[s].signature != e.signature])
+        self._snapshot = snapshot
+
+        # Swap in a new snapshot, only bump the version on a change
+        trains = tuple(e.train for e in snapshot.values())
+        if trains != self.snapshot.trains:
+            self.snapshot = Snapshot(self.snapshot.version + 1, trains)
+            store.save_snapshot(self.station_code, trains)
+
+    def _accept_trains(self, trains, now: dt):
+        previous = self._snapshot if self.incremental else {}
+        snapshot = {}
+        pending = []
         for t in trains:
             try:
-                new_train = STOCK_TRAIN.copy()
-
-                '''
-                Time processing
-                '''
-                # Parse scheduled departure time
-                time = dt.strptime(t['departure_time'], '%Y-%m-%dT%H:%M:%SZ')
-                time = UTC_TZ.localize(time)
-                # Convert for frontend
-                new_train['time'] = time.astimezone(LOCAL_TZ).strftime("%H:%M")
+                service_number = t['service_number']
+                signature = tuple(t[f] for f in SIGNATURE_FIELDS)
 
-                # Delay in seconds
-                secs = t['delay']
-                # Int + floor division to convert to whole minutes
-                new_train['delay'] = secs // 60
-
-                # add delay to actual departure time
-                actual_time = time + timedelta(seconds=secs)
+                entry = previous.get(service_number)
+                if entry is None or entry.signature != signature:
+                    # New or changed service
+                    parsed = self._parse_train(t)
+                    if parsed is None:
+                        continue
+                    entry = _Entry(signature, *parsed, resolved=False)
 
                 # Do not return this train if (time+delay) is in the past
-                if now > actual_time:
+                if now > entry.actual_time:
                     continue
 
-                '''
-                Platform processing
-                '''
-                # Actual departure platform
-                new_train['platform'] = t['platform_actual']
-                # Whether platform has been changed
-                new_train['platform_changed'] = t['platform_changed']
-
-                '''
-                Service name processing
-                '''
-                # Define a service prefix: Either line number or service type
-                service_prefix = 'UNK'
-                if t['line_number'] != None:
-                    service_prefix = t['line_number']
-                else:
-                    service_prefix = t['type_code']
-
-                # Get actual destination
-                destination = t['destination_actual']
-
-                # Skip this train if it's in the destination filter
-                if destination.lower() in self.destination_filter:
-                    continue
-
-                # Construct service label
-                new_train['service'] = f'{service_prefix} {destination}'
-
-                # Whether destination has been changed
-                new_train['destination_changed'] = destination != t['destination_planned']
-
-                '''
-                Rolling stock processing
-                '''
-                new_train['rolling_stock'] = self._update_rolling_stock(
-                    t['service_number'], t['service_date'])
-
-                '''
-                Cancelled state
-                '''
-                new_train['cancelled'] = t['cancelled']
-
                 '''
                 Finalise parsing
                 '''
                 # Append train, if limit is parsed stop parsing.
-                parsed_trains.append(new_train)
-                if len(parsed_trains) >= self.limit:
+                snapshot[service_number] = entry
+                if not entry.resolved:
+                    pending.append(entry)
+                if len(snapshot) >= self.limit:
                     break
             except Exception as e:
+                metrics.parse_failures.inc(self.station_code)
                 self._log(f'Failed to parse train: {e}\r\nJSON: {str(t)}')
-        self.trains = parsed_trains
-        self._log(
-            f'Fetched departures for {self.station_code}, took {(dt.now(tz=UTC_TZ) - now).total_seconds()}s.')
+        return snapshot, pending
+
+    def _parse_train(self, t: dict):
+        '''
+        Time processing
+        '''
+        # Parse scheduled departure time
+        time = timeparse.parse_utc(t['departure_time'])
+        # Convert for frontend
+        display_time = timeparse.display_time(time)
+
+        # Delay in seconds
+        secs = t['delay']
+        # Int + floor division to convert to whole minutes
+        delay = secs // 60
+
+        # add delay to actual departure time
+        actual_time = time + timedelta(seconds=secs)
+
+        '''
+        Platform processing
+        '''
+        # Actual departure platform
+        platform = t['platform_actual']
+        # Whether platform has been changed
+        platform_changed = t['platform_changed']
+
+        '''
+        Service name processing
+        '''
+        # Define a service prefix: Either line number or service type
+        service_prefix = 'UNK'
+        if t['line_number'] != None:
+            service_prefix = t['line_number']
+        else:
+            service_prefix = t['type_code']
+
+        # Get actual destination
+        destination = t['destination_actual']
+
+        # Skip this train if it's in the destination filter
+        if station_index.index().code(destination) in self.destination_filter:
+            return None
+
+        # Construct service label
+        service_label = f'{service_prefix} {destination}'
+
+        # Whether destination has been changed
+        destination_changed = destination != t['destination_planned']
+
+        '''
+        Cancelled state
+        '''
+        cancelled = t['cancelled']
+
+        train = Train(cancelled=cancelled,
+                      time=display_time,
+                      delay=delay,
+                      platform_changed=platform_changed,
+                      platform=platform,
+                      destination_changed=destination_changed,
+                      service=service_label,
+                      station=self.station_code,
+                      departs_at=actual_time.timestamp())
+        return train, actual_time, (t['service_number'], t['service_date'])
+
+    def _resolve_rolling_stock(self, pending: list):
+        # Fetch all compositions in parallel, trains keep their order
+        futures = [_composition_pool.submit(self._update_rolling_stock, *e.service) for e in pending]
+        done, not_done = wait(futures, timeout=COMPOSITION_DEADLINE)
+
+        for entry, future in zip(pending, futures):
+            if future not in done:
+                # Missed the deadline, leave rolling stock unknown and retry next poll
+                future.cancel()
+            elif future.exception() is not None:
+                # Lookup failed, retry next poll as well
+                self._log(f'Rolling stock exception for {entry.service[0]}: {future.exception()}')
+            else:
+                entry.train = entry.train._replace(rolling_stock=future.result())
+                entry.resolved = True
+        if not_done:
+            self._log(f'Rolling stock deadline missed for {len(not_done)} trains at {self.station_code}')
 
     def _update_rolling_stock(self, service_number: str, service_date: str):
-        try:
-            url = f'{constants.gotrain_api_base_url}/v2/services/service/{service_number}/{service_date}'
-            response = requests.get(url=url)
-            if response == None:
-                return ''
-
-            stops = response.json()['service']['parts'][0]['stops']
-            for stop in stops:
-                if stop['station']['code'] == self.station_code:
-                    departing_mats = []
-                    for mat in stop['material']:
-                        if not mat['remains_behind']:
-                            departing_mats.append(mat['type'])
-                    return self._parse_rolling_stock(departing_mats)
-            return ''
-        except Exception as e:
-            print(f'Exception: {e}')
-            return ''
-
-    def _parse_rolling_stock(self, material: list[str]) -> str:
-        type = None
-        total_length = 0
-
-        for m in material:
-            if 'E-LOC' in m:
-                continue
-            if 'DB-BER9' in m:
-                type = 'BER'
-                total_length += 9
-                continue
-
-            for t in ['ICM', 'VIRM', 'DDZ', 'SLT', 'FLIRT', 'SNG', 'LINT']:
-                if t in m and m[-1].isnumeric():
-                    type = t
-                    total_length += int(m[-1])
-                    continue
-        if (type is not None and total_length > 0):
-            return f'{type}-{total_length}'
-        else:
-            return ''
+        # Raises on a failed lookup, so the train is not marked resolved
+        # Compositions are shared between stations, keyed by service
+        key = (service_number, service_date)
+        service_stops = cache.compositions.get(key)
+        if service_stops is None:
+            service_stops = self._fetch_composition(service_number, service_date)
+            cache.compositions.put(key, service_stops)
+            store.save_composition(key, service_stops)
+
+        departing_mats = service_stops.get(self.station_code)
+        if departing_mats is None:
+            return None
+        return rollingstock.classify(departing_mats)
+
+    def _fetch_composition(self, service_number: str, service_date: str):
+        url = f'{constants.gotrain_api_base_url}/v2/services/service/{service_number}/{service_date}'
+        return _service_flights.do(url, _load_composition, url)
+
+
+def _load_composition(url: str) -> dict:
+    service = transport.get_json(url, 'service', 'compositions')
+
+    # Departing material per station code, for every stop of the service
+    service_stops = {}
+    stops = service['service']['parts'][0]['stops']
+    for stop in stops:
+        departing_mats = []
+        for mat in stop['material']:
+            if not mat['remains_behind']:
+                departing_mats.append(mat['type'])
+        service_stops.setdefault(stop['station']['code'], tuple(departing_mats))
+    return service_stops
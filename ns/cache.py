@@ -0,0 +1,76 @@
+import threading
+
+from collections import OrderedDict
+
+from ns import metrics, timeparse
+
+
+class CompositionCache:
+    '''
+    Bounded LRU cache with TTL eviction for service compositions.
+    Keyed by (service_number, service_date), shared by all stations.
+    Entries expire on timeparse.clock, so a replay ages them at its speed.
+    '''
+
+    def __init__(self, max_size: int = 512, ttl: int = 60 * 60) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, value = entry
+            if timeparse.clock.monotonic() > expires:
+                # Expired, treat as a miss
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl: float = None):
+        # ttl overrides the default, e.g. for entries that are already older
+        with self._lock:
+            self._entries[key] = (timeparse.clock.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            # Drop least recently used entries
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+compositions = CompositionCache()
+
+metrics.collector('composition_cache_events_total', 'Composition cache hits, misses and evictions',
+                  'counter', lambda: {(event,): compositions.stats()[event] for event in ('hits', 'misses', 'evictions')},
+                  ('event',))
+metrics.collector('composition_cache_size', 'Compositions in the cache',
+                  'gauge', lambda: {(): len(compositions)})
@@ -0,0 +1,71 @@
+from operator import attrgetter
+
+import constants
+
+
+# Train fields whose change means the situation at the station is changing
+_disruption = attrgetter('delay', 'platform', 'platform_changed', 'cancelled')
+
+
+def disrupted(previous: dict, trains: dict) -> int:
+    '''
+    Number of services in both {service: Train} dicts whose delay, platform
+    or cancellation changed. Trains arriving and leaving do not count.
+    '''
+    return sum(1 for s, t in trains.items()
+               if s in previous and _disruption(previous[s]) != _disruption(t))
+
+
+class Cadence:
+    '''
+    Polling interval of a station, adapted to what the polls find. Changed
+    delays, platforms or cancellations shrink it, polls without any change
+    stretch it, always within [minimum, maximum]. While a train is about to
+    leave the interval is at most `imminent_interval`.
+    '''
+
+    def __init__(self, minimum: float = 15, maximum: float = 300, initial: float = 60,
+                 shrink: float = 0.5, stretch: float = 1.5,
+                 imminent: float = 2 * 60, imminent_interval: float = 30) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.shrink = shrink
+        self.stretch = stretch
+        # Seconds before a departure it counts as imminent
+        self.imminent = imminent
+        self.imminent_interval = imminent_interval
+        self.initial = initial
+        self._interval = initial
+        self.interval = initial
+
+    @classmethod
+    def from_constants(cls):
+        # constants.poll_interval = (minimum, maximum) in seconds
+        minimum, maximum = getattr(constants, 'poll_interval', (15, 300))
+        return cls(minimum, maximum, min(max(60, minimum), maximum))
+
+    def failed(self) -> float:
+        '''
+        A poll failed, retry no later than the initial interval and sooner
+        on every further failure.
+        '''
+        self._interval = max(self.minimum, min(self._interval * self.shrink, self.initial))
+        self.interval = self._interval
+        return self.interval
+
+    def observe(self, disruptions: int, changed: bool, trains: tuple, now: float) -> float:
+        '''
+        Adapt to a poll and return the seconds until the next one.
+        '''
+        if disruptions:
+            self._interval *= self.shrink
+        elif not changed:
+            self._interval *= self.stretch
+        self._interval = min(self.maximum, max(self.minimum, self._interval))
+
+        interval = self._interval
+        upcoming = [t.departs_at - now for t in trains if t.departs_at > now]
+        if upcoming and min(upcoming) < self.imminent:
+            interval = min(interval, max(self.minimum, self.imminent_interval))
+        self.interval = interval
+        return interval
@@ -0,0 +1,115 @@
+import json
+import threading
+
+from ns import metrics, transport
+
+
+# Seconds without any data before the stream counts as dropped
+READ_TIMEOUT = 30
+# Reconnect backoff cap in seconds
+RECONNECT_CAP = 60
+
+
+def iter_events(lines):
+    '''
+    Server-sent events as (event, data) tuples, from decoded lines.
+    '''
+    event, data = 'message', []
+    for line in lines:
+        if not line:
+            # Blank line dispatches the event
+            if data:
+                yield event, '\n'.join(data)
+            event, data = 'message', []
+            continue
+        if line.startswith(':'):
+            continue  # Comment, used as keep-alive
+        field, _, value = line.partition(':')
+        value = value[1:] if value.startswith(' ') else value
+        if field == 'event':
+            event = value
+        elif field == 'data':
+            data.append(value)
+
+
+class Feed:
+    '''
+    Subscribes to a stream of departure updates (server-sent events) and
+    applies them to the snapshots of the stations. While connected the
+    scheduler only polls to resync; when the stream drops it falls back to
+    regular polling until the feed reconnects.
+
+    Every event is a departure update:
+
+        event: departure
+        data: {"station": "UT", "departure": {...}}
+    '''
+
+    def __init__(self, url: str, departures: list, scheduler=None) -> None:
+        self.url = url
+        self.scheduler = scheduler
+        self.connected = False
+        self._departures = {d.station_code: d for d in departures}
+        self._response = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='feed', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        response = self._response
+        if response is not None:
+            response.close()  # Unblocks the reader
+
+    def _set_connected(self, connected: bool):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        metrics.feed_events.inc('connects' if connected else 'drops')
+        if self.scheduler is not None:
+            self.scheduler.set_pushed(connected)
+
+    def _run(self):
+        attempt = 0
+        while not self._stopped.is_set():
+            try:
+                stations = ','.join(self._departures)
+                self._response = transport.get(
+                    f'{self.url}?stations={stations}', 'feed', stream=True,
+                    timeout=(transport.TIMEOUT[0], READ_TIMEOUT),
+                    headers={'Accept': 'text/event-stream'})
+                self._set_connected(True)
+                attempt = 0
+                for event, data in iter_events(self._response.iter_lines(decode_unicode=True)):
+                    if event == 'departure':
+                        self._apply(data)
+            except Exception as e:
+                if not self._stopped.is_set():
+                    print(f'Feed exception: {e}')
+            finally:
+                if self._response is not None:
+                    self._response.close()
+                    self._response = None
+
+            self._set_connected(False)
+            attempt += 1
+            self._stopped.wait(min(RECONNECT_CAP, transport.backoff(attempt) + 1))
+
+    def _apply(self, data: str):
+        metrics.feed_events.inc('updates')
+        if self.scheduler is not None and self.scheduler.suspended:
+            return  # Quiet hours, nothing is shown
+        # Label of updates that fail before their station is known
+        station_code = 'unknown'
+        try:
+            update = json.loads(data)
+            station_code = update['station'].upper()
+            departures = self._departures.get(station_code)
+            if departures is not None:
+                departures.apply_update(update['departure'])
+        except Exception as e:
+            # A bad update is skipped, the stream stays up
+            metrics.parse_failures.inc(station_code)
+            print(f'Failed to parse feed update: {e}\r\nJSON: {data}')
@@ -0,0 +1,92 @@
+import heapq
+import itertools
+import threading
+import time
+
+from contextlib import contextmanager
+
+import constants
+
+from ns import metrics
+
+
+# Priority lanes, earlier lanes go first: departures of the station on
+# screen, departures of the other stations, then rolling stock lookups
+LANES = ('display', 'departures', 'compositions')
+
+
+class Governor:
+    '''
+    Process wide limit on GoTrain requests: a token bucket refilled at qps
+    with room for a burst, and at most `concurrency` requests in flight.
+    Waiting requests are served by lane, then in arrival order.
+    '''
+
+    def __init__(self, qps: float = 5, burst: int = 10, concurrency: int = 4) -> None:
+        self.qps = qps
+        self.burst = burst
+        self.concurrency = concurrency
+        self.active = 0
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._waiting = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_constants(cls) -> 'Governor':
+        return cls(getattr(constants, 'gotrain_qps', 5),
+                   getattr(constants, 'gotrain_burst', 10),
+                   getattr(constants, 'gotrain_concurrency', 4))
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.qps)
+        self._refilled = now
+
+    def queued(self) -> dict:
+        with self._cond:
+            counts = dict.fromkeys(LANES, 0)
+            for rank, _ in self._waiting:
+                counts[LANES[rank]] += 1
+            return counts
+
+    @contextmanager
+    def slot(self, lane: str):
+        '''
+        Hold a request slot of the lane for the duration of the block.
+        '''
+        start = time.monotonic()
+        ticket = (LANES.index(lane), next(self._order))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._waiting[0] == ticket and self.active < self.concurrency:
+                    if self._tokens >= 1:
+                        break
+                    # First in line, sleep until the next token
+                    self._cond.wait((1 - self._tokens) / self.qps)
+                else:
+                    self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._tokens -= 1
+            self.active += 1
+            # The next in line may go too
+            self._cond.notify_all()
+        metrics.queue_wait_seconds.observe(time.monotonic() - start, lane)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify_all()
+
+
+governor = Governor.from_constants()
+
+metrics.collector('gotrain_requests_queued', 'Requests waiting for the governor', 'gauge',
+                  lambda: {(lane,): n for lane, n in governor.queued().items()}, ('lane',))
+metrics.collector('gotrain_requests_in_flight', 'Requests holding a governor slot', 'gauge',
+                  lambda: {(): governor.active})
@@ -0,0 +1,127 @@
+import codecs
+import json
+import re
+
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[\s,]*')
+# What may follow an item of an array
+_delimiters = ' \t\r\n,]'
+
+
+class _KeyScanner:
+    '''
+    Finds the array of a member `key` of the top level object, in a buffer
+    that grows. Members of nested objects are skipped.
+    '''
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        # Last string closed at the top level, until the next token
+        self.name = None
+        # A colon followed the wanted key, the value comes next
+        self.colon = False
+
+    def scan(self, buffer: str):
+        '''
+        Position just after the opening bracket of the array, or None if
+        it is not in the buffer yet.
+        '''
+        for i in range(self.pos, len(buffer)):
+            ch = buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.name = json.loads(buffer[self.string_start:i + 1])
+                continue
+            if ch in ' \t\r\n':
+                continue
+
+            if self.colon:
+                self.colon = False
+                if ch == '[':
+                    self.pos = i + 1
+                    return i + 1
+            elif ch == ':' and self.depth == 1 and self.name == self.key:
+                self.colon = True
+                self.name = None
+                continue
+            self.name = None
+
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+            elif ch in '{[':
+                self.depth += 1
+            elif ch in '}]':
+                self.depth -= 1
+        self.pos = len(buffer)
+        return None
+
+
+def iter_array(chunks, key: str):
+    '''
+    Yield the items of the top level array `key` of a JSON document, as its
+    chunks of bytes arrive. Stops reading once the array is closed, or when
+    the consumer stops iterating.
+    '''
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    scanner = _KeyScanner(key)
+    chunks = iter(chunks)
+    buffer = ''
+    exhausted = False
+
+    def read() -> bool:
+        nonlocal buffer, exhausted
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            return False
+        buffer += utf8.decode(chunk)
+        return True
+
+    # Find the opening of the array
+    pos = scanner.scan(buffer)
+    while pos is None:
+        if not read():
+            raise ValueError(f'No "{key}" array in document')
+        pos = scanner.scan(buffer)
+
+    while True:
+        pos = _whitespace.match(buffer, pos).end()
+        if pos == len(buffer):
+            if not read():
+                raise ValueError(f'Unterminated "{key}" array')
+            continue
+        if buffer[pos] == ']':
+            return
+
+        try:
+            item, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Item not complete yet
+            if not read():
+                raise
+            continue
+
+        # A number or literal is only complete once a delimiter follows it,
+        # 12 may be the start of 12345 or 1.5 of 1.5e3 in the next chunk
+        if (buffer[end - 1] not in '}]"' and not exhausted
+                and (end == len(buffer) or buffer[end] not in _delimiters)):
+            read()
+            continue
+
+        # Drop what has been parsed
+        buffer = buffer[end:]
+        pos = 0
+        yield item
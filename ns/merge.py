@@ -0,0 +1,57 @@
+import heapq
+
+from itertools import islice
+from operator import attrgetter
+
+from ns.records import Snapshot
+
+
+_departs_at = attrgetter('departs_at')
+
+
+class MergedBoard:
+    '''
+    Departures of several stations as one chronological list, by actual
+    departure time. Rows are tagged with their origin station.
+
+    Only stations whose snapshot changed are re-sorted, the sorted lists are
+    then combined with a k-way heap merge up to the limit.
+    '''
+
+    def __init__(self, departures: list, limit: int = 7, name: str = '') -> None:
+        self.departures = list(departures)
+        self.limit = limit
+        self.name = name or ' / '.join(d.station_code for d in self.departures)
+        self.station_code = '+'.join(d.station_code for d in self.departures)
+        # Per station: (snapshot version, tagged trains sorted by departure)
+        self._sorted = {}
+        self._snapshot = Snapshot()
+
+    def _tagged(self, d) -> tuple:
+        snapshot = d.snapshot
+        cached = self._sorted.get(d)
+        if cached is None or cached[0] != snapshot.version:
+            trains = sorted(snapshot.trains, key=_departs_at)
+            cached = (snapshot.version, tuple(t._replace(service=f'{t.station} {t.service}') for t in trains))
+            self._sorted[d] = cached
+        return cached[1]
+
+    @property
+    def snapshot(self) -> Snapshot:
+        versions = [self._sorted.get(d, (None,))[0] for d in self.departures]
+        lists = [self._tagged(d) for d in self.departures]
+        if versions == [self._sorted[d][0] for d in self.departures]:
+            return self._snapshot
+
+        trains = tuple(islice(heapq.merge(*lists, key=_departs_at), self.limit))
+        if trains != self._snapshot.trains:
+            self._snapshot = Snapshot(self._snapshot.version + 1, trains)
+        return self._snapshot
+
+    @property
+    def fetched(self):
+        # Once any of the stations was fetched
+        return max((d.fetched for d in self.departures if d.fetched is not None), default=None)
+
+    def get_trains(self) -> tuple:
+        return self.snapshot.trains
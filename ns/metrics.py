@@ -0,0 +1,165 @@
+import bisect
+import threading
+
+
+# Seconds, suits both API calls and frame times
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, value: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labels, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket (+Inf last), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(labels)
+            if v is None:
+                v = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            v[0][i] += 1
+            v[1] += value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+class Collector:
+    '''
+    Values read when scraped, from a callback returning {labels: value}.
+    '''
+
+    def __init__(self, name: str, help: str, type: str, callback, labels: tuple = ()) -> None:
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labels = labels
+        self.callback = callback
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for labels, value in sorted(self.callback().items()):
+            lines.append(f'{self.name}{_labels(self.labels, labels)} {value}')
+        return lines
+
+
+_metrics = []
+
+
+def counter(name: str, help: str, labels: tuple = ()) -> Counter:
+    m = Counter(name, help, labels)
+    _metrics.append(m)
+    return m
+
+
+def histogram(name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    m = Histogram(name, help, labels, buckets)
+    _metrics.append(m)
+    return m
+
+
+def collector(name: str, help: str, type: str, callback, labels: tuple = ()) -> Collector:
+    m = Collector(name, help, type, callback, labels)
+    _metrics.append(m)
+    return m
+
+
+def render() -> str:
+    '''
+    All metrics in the Prometheus text format.
+    '''
+    lines = []
+    for m in _metrics:
+        try:
+            lines.extend(m.render())
+        except Exception as e:
+            lines.append(f'# {m.name} failed: {e}')
+    return '\n'.join(lines) + '\n'
+
+
+def _handler():
+    # http.server is imported on first use, it is only needed when serving
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    return Handler
+
+
+def serve(port: int, host: str = '127.0.0.1'):
+    '''
+    Serve /metrics on a daemon thread.
+    '''
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), _handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+'''
+Metrics of the board
+'''
+request_seconds = histogram('gotrain_request_seconds', 'GoTrain API request latency', ('endpoint',))
+queue_wait_seconds = histogram('gotrain_queue_wait_seconds', 'Time requests wait for the governor', ('lane',))
+refresh_seconds = histogram('departures_refresh_seconds', 'Refresh duration per station', ('station',))
+parse_failures = counter('departures_parse_failures_total', 'Departures that failed to parse', ('station',))
+scheduler_lag = histogram('scheduler_lag_seconds', 'Delay between a refresh being due and starting')
+feed_events = counter('departures_feed_events_total', 'Departure feed updates, connects and drops', ('event',))
+render_seconds = histogram('board_render_seconds', 'Time to redraw the board', ('renderer',))
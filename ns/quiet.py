@@ -0,0 +1,54 @@
+from datetime import datetime as dt, time, timedelta
+
+import constants
+
+
+class QuietHours:
+    '''
+    Daily window in which the board is offline and no API calls are made.
+    Polling resumes `warmup` before the window ends, so the caches are
+    filled again by the time the board comes back.
+    '''
+
+    def __init__(self, start: time = time(0, 0), end: time = time(5, 0),
+                 warmup: timedelta = timedelta(minutes=5)) -> None:
+        self.start = start
+        self.end = end
+        self.warmup = warmup
+
+    @classmethod
+    def from_constants(cls):
+        # constants.quiet_hours = ('00:00', '05:00'), constants.quiet_warmup = minutes
+        start, end = getattr(constants, 'quiet_hours', ('00:00', '05:00'))
+        warmup = getattr(constants, 'quiet_warmup', 5)
+        return cls(time.fromisoformat(start), time.fromisoformat(end), timedelta(minutes=warmup))
+
+    def _in_window(self, t: time, start: time, end: time) -> bool:
+        if start == end:
+            return False
+        if start < end:
+            return start <= t < end
+        # Window wraps past midnight
+        return t >= start or t < end
+
+    def is_quiet(self, now: dt) -> bool:
+        return self._in_window(now.time(), self.start, self.end)
+
+    def is_paused(self, now: dt) -> bool:
+        # Quiet, and not yet warming up for the end of the window
+        warmup_start = (dt.combine(now.date(), self.end) - self.warmup).time()
+        return self.is_quiet(now) and not self._in_window(now.time(), warmup_start, self.end)
+
+    def resumes_in(self, now: dt) -> float:
+        '''
+        Seconds until polling resumes, 0 if it is not paused.
+        '''
+        if not self.is_paused(now):
+            return 0
+        resume = dt.combine(now.date(), self.end) - self.warmup
+        if resume <= now:
+            resume += timedelta(days=1)
+        return (resume - now).total_seconds()
+
+    def label(self) -> str:
+        return f'Offline till {self.end.hour}:{self.end.minute:02}'
@@ -0,0 +1,37 @@
+from typing import NamedTuple, Optional
+
+from ns.rollingstock import RollingStock
+
+
+class Train(NamedTuple):
+    '''
+    A departure as shown on the board. Immutable, and slotted like any tuple.
+    '''
+    cancelled: bool = False
+
+    time: str = ''
+    delay: int = 0
+
+    platform_changed: bool = False
+    platform: str = ''
+
+    destination_changed: bool = False
+    service: str = ''
+
+    rolling_stock: Optional[RollingStock] = None
+
+    # Origin station code, and actual departure (scheduled + delay) as epoch seconds
+    station: str = ''
+    departs_at: float = 0
+
+    # Restored from disk, not refreshed yet
+    stale: bool = False
+
+
+class Snapshot(NamedTuple):
+    '''
+    The departures of a station. Replaced as a whole on every change, so
+    readers need no copies and can compare versions to detect changes.
+    '''
+    version: int = 0
+    trains: tuple = ()
@@ -0,0 +1,186 @@
+'''
+Record GoTrain traffic to a log, and replay it at any speed.
+
+The log is gzipped JSON lines, one response per line:
+
+    {"t": 1697612400.12, "endpoint": "departures", "path": "/v2/departures/station/UT", "body": "..."}
+
+While replaying, transport.get answers every request with the latest
+response recorded for its path at the time of the replay clock.
+'''
+import atexit
+import bisect
+import gzip
+import json
+import signal
+import sys
+import threading
+import time
+import zlib
+
+from urllib.parse import urlsplit
+
+import requests
+
+from ns import timeparse, transport
+
+
+# Endpoints that are not recorded: the event feed never ends, and is not
+# replayed either
+UNRECORDED = {'feed'}
+
+
+class Recorder:
+    '''
+    Appends every successful response to a gzipped JSON lines log.
+    Streamed responses are read completely, so they can be replayed.
+    Every record is flushed, so a killed recording keeps all but the last.
+    '''
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.records = 0
+        self._log = gzip.open(path, 'ab')
+        self._lock = threading.Lock()
+
+    def record(self, url: str, endpoint: str, response: requests.Response):
+        if endpoint in UNRECORDED:
+            return
+        line = json.dumps({
+            't': timeparse.clock.time(),
+            'endpoint': endpoint,
+            'path': urlsplit(url).path,
+            'body': response.text,
+        })
+        with self._lock:
+            if self._log.closed:
+                return
+            self._log.write(f'{line}\n'.encode())
+            # Readable up to here, whatever happens to the process
+            self._log.flush(zlib.Z_SYNC_FLUSH)
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._log.close()
+
+
+def read_log(path: str):
+    '''
+    Records of a log, up to where it was cut off if recording was killed.
+    '''
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    return  # Last line was cut off
+                yield record
+        except EOFError:
+            pass  # No end of stream marker
+
+
+class ReplayClock(timeparse.Clock):
+    '''
+    Starts at the first recorded response and runs `speed` times as fast
+    as the wall clock.
+    '''
+
+    def __init__(self, start: float, speed: float = 1) -> None:
+        self.start = start
+        self.speed = speed
+        self._origin = time.monotonic()
+
+    def monotonic(self) -> float:
+        return (time.monotonic() - self._origin) * self.speed
+
+    def time(self) -> float:
+        return self.start + self.monotonic()
+
+
+class SteppedClock(timeparse.Clock):
+    '''
+    Stands still until it is moved, to replay as fast as possible without
+    a scheduler.
+    '''
+    speed = float('inf')
+
+    def __init__(self, start: float) -> None:
+        self.at = start
+
+    def advance_to(self, t: float):
+        self.at = max(self.at, t)
+
+    def monotonic(self) -> float:
+        return self.at
+
+    def time(self) -> float:
+        return self.at
+
+
+class Player:
+    '''
+    Serves recorded responses by path. A request gets the latest response
+    recorded at or before the clock, or the first one if it is earlier.
+    '''
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # (time, endpoint, path) of every response, in recorded order
+        self.records = []
+        self._times = {}
+        self._bodies = {}
+        for record in read_log(path):
+            self.records.append((record['t'], record['endpoint'], record['path']))
+            self._times.setdefault(record['path'], []).append(record['t'])
+            self._bodies.setdefault(record['path'], []).append(record['body'])
+        if not self.records:
+            raise ValueError(f'{path}: no recorded responses')
+        self.start = self.records[0][0]
+        self.end = self.records[-1][0]
+
+    def response(self, url: str, endpoint: str) -> requests.Response:
+        path = urlsplit(url).path
+        times = self._times.get(path)
+        if times is None:
+            raise transport.TransportError(f'{endpoint} not recorded: {path}')
+        i = max(0, bisect.bisect_right(times, timeparse.clock.time()) - 1)
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.encoding = 'utf-8'
+        response._content = self._bodies[path][i].encode()
+        response._content_consumed = True
+        return response
+
+
+def _terminate(signum, frame):
+    close()
+    sys.exit(128 + signum)
+
+
+def record(path: str) -> Recorder:
+    transport.recorder = Recorder(path)
+    # Finish the log on exit, and when stopped by the service manager
+    atexit.register(close)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _terminate)
+    return transport.recorder
+
+
+def replay(path: str, speed: float = 1) -> Player:
+    '''
+    Answer all requests from the log, on a clock starting at its first response.
+    '''
+    player = Player(path)
+    timeparse.set_clock(ReplayClock(player.start, speed))
+    transport.player = player
+    return player
+
+
+def close():
+    if transport.recorder is not None:
+        transport.recorder.close()
+        transport.recorder = None
@@ -0,0 +1,88 @@
+import re
+
+from functools import lru_cache
+from typing import NamedTuple
+
+
+# (type, pattern) per material, first match wins. Units are the digits after
+# the type, e.g. VIRM-6 or ICNG-8. A type of None is not counted (locomotives).
+MATERIAL_TYPES = [
+    (None, r'E-?LOC'),
+    ('BER', r'DB-BER-?(?P<units>\d+)'),
+    ('ICNG', r'ICNG-?(?P<units>\d+)'),
+    ('ICM', r'ICM-?(?P<units>\d+)'),
+    ('VIRM', r'VIRM-?(?P<units>\d+)'),
+    ('DDZ', r'DDZ-?(?P<units>\d+)'),
+    ('DDAR', r'DDAR-?(?P<units>\d+)'),
+    ('SLT', r'SLT-?(?P<units>\d+)'),
+    ('SGM', r'SGM-?(?P<units>\d+)'),
+    ('FLIRT', r'FLIRT-?(?P<units>\d+)'),
+    ('SNG', r'SNG-?(?P<units>\d+)'),
+    ('GTW', r'GTW-?(?P<units>\d+)'),
+    ('LINT', r'LINT-?(?P<units>\d+)'),
+]
+
+_compiled = [(type, re.compile(pattern)) for type, pattern in MATERIAL_TYPES]
+
+
+class RollingStock(NamedTuple):
+    '''
+    Classified composition of a departing train.
+    '''
+    # Type of the (first) train set, e.g. VIRM
+    type: str
+    # Carriages per train set, e.g. (4, 6) for double traction
+    units: tuple
+    # Total number of carriages
+    length: int
+    # More than one type of train set
+    mixed: bool
+    types: tuple = ()
+
+    @property
+    def label(self) -> str:
+        if self.mixed:
+            return f'{"/".join(self.types)}-{self.length}'
+        return f'{self.type}-{self.length}'
+
+    def __str__(self) -> str:
+        return self.label
+
+
+@lru_cache(maxsize=256)
+def _classify_material(material: str):
+    for type, pattern in _compiled:
+        match = pattern.search(material)
+        if match is not None:
+            if type is None:
+                return None
+            return type, int(match.group('units'))
+    return None
+
+
+@lru_cache(maxsize=1024)
+def classify(material: tuple):
+    '''
+    Classify the departing material of a train, e.g. ('VIRM-4', 'VIRM-6').
+    None if none of it is recognised.
+    '''
+    types = []
+    units = []
+    for m in material:
+        classified = _classify_material(m)
+        if classified is None:
+            continue
+        type, n = classified
+        if type not in types:
+            types.append(type)
+        units.append(n)
+
+    if not units:
+        return None
+    return RollingStock(type=types[0], units=tuple(units), length=sum(units),
+                        mixed=len(types) > 1, types=tuple(types))
+
+
+def label(rolling_stock) -> str:
+    # Board text, empty when unknown
+    return rolling_stock.label if rolling_stock is not None else ''
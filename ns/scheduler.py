@@ -0,0 +1,154 @@
+import threading
+
+from ns import cache, metrics, timeparse
+
+
+class _Job:
+    def __init__(self, departures, due: float) -> None:
+        self.departures = departures
+        self.due = due
+        self.last_run = None
+
+
+class Scheduler:
+    '''
+    Owns the refreshes of all stations on a single worker thread.
+    The station that is shown next on the board is refreshed first.
+    Follows timeparse.clock, so a replay runs on its accelerated time.
+    '''
+
+    def __init__(self, interval: int = 60, stale_after: int = None, quiet=None,
+                 resync_interval: int = 5 * 60) -> None:
+        # Seconds between refreshes of a station without a cadence of its own
+        self.interval = interval
+        # Seconds between refreshes while a feed pushes the updates
+        self.resync_interval = resync_interval
+        self.pushed = False
+        # A prioritised station older than this, or its poll interval if that
+        # is longer, is refreshed right away, so priority adds no calls
+        self.stale_after = stale_after
+        # Optional QuietHours, no polling while paused
+        self.quiet = quiet
+        self.suspended = False
+        self._jobs = {}
+        # Stations shown next on the board
+        self._priority = ()
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+
+    def register(self, departures, delay: float = 0):
+        with self._cond:
+            self._jobs[departures] = _Job(departures, timeparse.clock.monotonic() + delay)
+            self._cond.notify()
+
+    def cancel(self, departures):
+        with self._cond:
+            self._jobs.pop(departures, None)
+            self._priority = tuple(d for d in self._priority if d is not departures)
+
+    def prioritise(self, board):
+        '''
+        Refresh the stations of the board shown next first, a station or
+        a MergedBoard of several.
+        '''
+        with self._cond:
+            self._priority = tuple(getattr(board, 'departures', (board,)))
+            now = timeparse.clock.monotonic()
+            for departures in self._priority:
+                job = self._jobs.get(departures)
+                if job is None:
+                    continue
+                # Never sooner than the station's own cadence asks for
+                stale_after = max(self.stale_after or 0, self._interval(job))
+                if job.last_run is None or now - job.last_run >= stale_after:
+                    job.due = min(job.due, now)
+                    self._cond.notify()
+
+    def set_pushed(self, pushed: bool):
+        '''
+        Called by a Feed. Polling slows down to resyncs while updates are
+        pushed, and every station is refreshed right away when the feed drops.
+        '''
+        with self._cond:
+            self.pushed = pushed
+            if not pushed:
+                now = timeparse.clock.monotonic()
+                for job in self._jobs.values():
+                    job.due = min(job.due, now)
+                self._cond.notify()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: float = 2):
+        with self._cond:
+            self._stopped = True
+            self._jobs.clear()
+            self._cond.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _interval(self, job: _Job) -> float:
+        if self.pushed:
+            return self.resync_interval
+        # Stations adapt their own polling cadence
+        cadence = getattr(job.departures, 'cadence', None)
+        return self.interval if cadence is None else cadence.interval
+
+    def _next_job(self, now: float):
+        # Among due jobs the prioritised station goes first, then the most overdue
+        return min(self._jobs.values(),
+                   key=lambda j: (max(j.due, now), j.departures not in self._priority, j.due),
+                   default=None)
+
+    def _suspend(self):
+        # Free the snapshots and compositions, nothing is shown overnight
+        self.suspended = True
+        for job in self._jobs.values():
+            job.departures.clear()
+        cache.compositions.clear()
+
+    def _resume(self):
+        # Warm up every station right away
+        self.suspended = False
+        now = timeparse.clock.monotonic()
+        for job in self._jobs.values():
+            job.due = now
+            job.last_run = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                if self.quiet is not None:
+                    paused_for = self.quiet.resumes_in(timeparse.clock.now())
+                    if paused_for > 0:
+                        if not self.suspended:
+                            self._suspend()
+                        # Re-check at least every minute, in case the clock jumps
+                        self._cond.wait(min(paused_for, 60) / timeparse.clock.speed)
+                        continue
+                    if self.suspended:
+                        self._resume()
+
+                now = timeparse.clock.monotonic()
+                job = self._next_job(now)
+                if job is None or job.due > now:
+                    self._cond.wait(None if job is None else (job.due - now) / timeparse.clock.speed)
+                    continue
+                metrics.scheduler_lag.observe(now - job.due)
+                job.due = scheduled = now + self._interval(job)
+                job.last_run = now
+                displayed = job.departures in self._priority
+
+            try:
+                job.departures.refresh(displayed)
+            except Exception as e:
+                print(f'Scheduler exception for {job.departures.station_code}: {e}')
+
+            with self._cond:
+                # The refresh may have changed the cadence, unless the job was moved meanwhile
+                if job.due == scheduled:
+                    job.due = job.last_run + self._interval(job)
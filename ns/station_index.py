@@ -0,0 +1,92 @@
+import bisect
+import difflib
+import re
+import unicodedata
+
+from functools import lru_cache
+
+
+_separators = re.compile(r"[\s\-'.()/]+")
+
+
+@lru_cache(maxsize=2048)
+def normalise(name: str) -> str:
+    '''
+    Accent and case folded name, e.g. "'s-Hertogenbosch" -> "s hertogenbosch".
+    '''
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _separators.sub(' ', stripped.casefold()).strip()
+
+
+class StationIndex:
+    '''
+    Lookups over the station table: code to name, name to code, prefix
+    search for autocomplete and fuzzy matching of misspelled names.
+    '''
+
+    def __init__(self, codes: dict) -> None:
+        self._names = dict(codes)
+        self._codes = {}
+        for code, name in codes.items():
+            self._codes.setdefault(normalise(name), code)
+        # Sorted normalised names for prefix search
+        self._sorted = sorted(self._codes)
+
+    def __len__(self):
+        return len(self._names)
+
+    def name(self, code: str) -> str:
+        return self._names[code.lower()]
+
+    def code(self, name: str):
+        '''
+        Code of an exactly matching (normalised) name, None if unknown.
+        '''
+        return self._codes.get(normalise(name))
+
+    def prefix(self, prefix: str, limit: int = 10) -> list:
+        '''
+        Codes of the stations whose name starts with prefix, alphabetically.
+        '''
+        prefix = normalise(prefix)
+        start = bisect.bisect_left(self._sorted, prefix)
+        matches = []
+        for name in self._sorted[start:]:
+            if not name.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(self._codes[name])
+        return matches
+
+    def fuzzy(self, name: str, limit: int = 3, cutoff: float = 0.75) -> list:
+        '''
+        Codes of the closest matching names, best first.
+        '''
+        matches = difflib.get_close_matches(normalise(name), self._sorted, n=limit, cutoff=cutoff)
+        return [self._codes[m] for m in matches]
+
+    def resolve(self, entry: str) -> str:
+        '''
+        Code for a config entry, either a code or a (possibly misspelled) name.
+        '''
+        if entry.lower() in self._names:
+            return entry.lower()
+        code = self.code(entry)
+        if code is not None:
+            return code
+        matches = self.fuzzy(entry, limit=1)
+        if matches:
+            return matches[0]
+        raise KeyError(f'Unknown station: {entry}')
+
+
+_index = None
+
+
+def index() -> StationIndex:
+    # Built on first use, like the stations table it is loaded from
+    global _index
+    if _index is None:
+        from ns import stations
+        _index = StationIndex(stations.codes)
+    return _index
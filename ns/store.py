@@ -0,0 +1,183 @@
+import json
+import sqlite3
+import threading
+import time
+
+from ns.records import Train
+from ns.rollingstock import RollingStock
+
+
+# Seconds between writes, keeps the SD card quiet
+FLUSH_INTERVAL = 5 * 60
+
+
+def _encode_train(t: Train) -> dict:
+    train = t._asdict()
+    if t.rolling_stock is not None:
+        train['rolling_stock'] = list(t.rolling_stock)
+    del train['stale']
+    return train
+
+
+def _decode_train(train: dict) -> Train:
+    # Fields no longer in Train are dropped, new ones take their default
+    train = {field: value for field, value in train.items() if field in Train._fields}
+    rolling_stock = train.get('rolling_stock')
+    if rolling_stock is not None:
+        type, units, length, mixed, types = rolling_stock
+        train['rolling_stock'] = RollingStock(type, tuple(units), length, mixed, tuple(types))
+    train['stale'] = True
+    return Train(**train)
+
+
+def _decode_trains(trains: str) -> tuple:
+    decoded = []
+    for train in json.loads(trains):
+        try:
+            decoded.append(_decode_train(train))
+        except (TypeError, ValueError) as e:
+            # Stored by a version that no longer matches, the refresh brings it back
+            print(f'Skipped stored train: {e}')
+    return tuple(decoded)
+
+
+class Store:
+    '''
+    SQLite store for the last snapshot of every station and the cached
+    compositions. Writes are kept in memory and flushed in one transaction
+    every FLUSH_INTERVAL seconds, and on close.
+    '''
+
+    def __init__(self, path: str, flush_interval: float = FLUSH_INTERVAL) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                station TEXT PRIMARY KEY,
+                saved_at REAL NOT NULL,
+                trains TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS compositions (
+                service_number TEXT NOT NULL,
+                service_date TEXT NOT NULL,
+                saved_at REAL NOT NULL,
+                stops TEXT NOT NULL,
+                PRIMARY KEY (service_number, service_date)
+            );
+        ''')
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._compositions = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='store', daemon=True)
+        self._thread.start()
+
+    def save_snapshot(self, station: str, trains: tuple):
+        with self._lock:
+            self._snapshots[station] = (time.time(), trains)
+
+    def save_composition(self, key: tuple, stops: dict):
+        with self._lock:
+            self._compositions[key] = (time.time(), stops)
+
+    def load_snapshots(self) -> dict:
+        '''
+        {station: trains} of the stored snapshots, every train marked stale.
+        '''
+        with self._lock:
+            rows = self._db.execute('SELECT station, trains FROM snapshots').fetchall()
+        return {station: _decode_trains(trains) for station, trains in rows}
+
+    def load_compositions(self, max_age: float) -> dict:
+        '''
+        {key: (saved_at, stops)} of the compositions younger than max_age.
+        '''
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT service_number, service_date, saved_at, stops FROM compositions WHERE saved_at > ?',
+                (time.time() - max_age,)).fetchall()
+        return {(number, date): (saved_at, {code: tuple(mats) for code, mats in json.loads(stops).items()})
+                for number, date, saved_at, stops in rows}
+
+    def flush(self):
+        with self._lock:
+            snapshots, self._snapshots = self._snapshots, {}
+            compositions, self._compositions = self._compositions, {}
+            if not snapshots and not compositions:
+                return
+            with self._db:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)',
+                    [(station, saved_at, json.dumps([_encode_train(t) for t in trains]))
+                     for station, (saved_at, trains) in snapshots.items()])
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO compositions VALUES (?, ?, ?, ?)',
+                    [(number, date, saved_at, json.dumps(stops))
+                     for (number, date), (saved_at, stops) in compositions.items()])
+                # Compositions of past days are of no use
+                self._db.execute('DELETE FROM compositions WHERE saved_at < ?', (time.time() - 2 * 24 * 60 * 60,))
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f'Store exception: {e}')
+
+    def close(self):
+        # Let a running flush finish before the last one
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+
+_store = None
+
+
+def open_store(path: str) -> Store:
+    global _store
+    _store = Store(path)
+    return _store
+
+
+def save_snapshot(station: str, trains: tuple):
+    # No-op unless a store is open
+    if _store is not None:
+        _store.save_snapshot(station, trains)
+
+
+def save_composition(key: tuple, stops: dict):
+    if _store is not None:
+        _store.save_composition(key, stops)
+
+
+def restore(departures: list, compositions) -> int:
+    '''
+    Seed stations and the composition cache from the open store.
+    Past trains are dropped, the rest is shown as stale until refreshed.
+    '''
+    if _store is None:
+        return 0
+    now = time.time()
+    for key, (saved_at, stops) in _store.load_compositions(compositions.ttl).items():
+        # Expires when it would have without the restart
+        compositions.put(key, stops, compositions.ttl - (now - saved_at))
+
+    snapshots = _store.load_snapshots()
+    restored = 0
+    for d in departures:
+        trains = tuple(t for t in snapshots.get(d.station_code, ()) if t.departs_at > now)
+        if trains:
+            d.restore(trains)
+            restored += 1
+    return restored
+
+
+def close():
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
@@ -0,0 +1,66 @@
+import time
+
+from datetime import datetime as dt, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+
+UTC_TZ = timezone.utc
+LOCAL_TZ = ZoneInfo('Europe/Amsterdam')
+
+API_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+class Clock:
+    '''
+    The time as seen by the board. Replaced by a replay clock when
+    replaying recorded traffic, see ns.replay.
+    '''
+    # Clock seconds per wall clock second
+    speed = 1
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def now(self, tz=None) -> dt:
+        return dt.fromtimestamp(self.time(), tz)
+
+
+clock = Clock()
+
+
+def set_clock(c: Clock):
+    global clock
+    clock = c
+
+
+def parse_utc(value: str) -> dt:
+    '''
+    Parse a GoTrain timestamp, e.g. 2022-10-30T01:30:00Z, as an aware UTC datetime.
+    '''
+    # Fixed positions, fall back to strptime for anything unexpected
+    if len(value) == 20 and value[4] == '-' and value[7] == '-' and value[10] == 'T' \
+            and value[13] == ':' and value[16] == ':' and value[19] == 'Z':
+        try:
+            return dt(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                      int(value[11:13]), int(value[14:16]), int(value[17:19]), tzinfo=UTC_TZ)
+        except ValueError:
+            pass
+    return dt.strptime(value, API_FORMAT).replace(tzinfo=UTC_TZ)
+
+
+@lru_cache(maxsize=4096)
+def _display_minute(minute: int) -> str:
+    local = dt.fromtimestamp(minute * 60, LOCAL_TZ)
+    return f'{local.hour:02}:{local.minute:02}'
+
+
+def display_time(time: dt) -> str:
+    '''
+    Local HH:MM of an aware datetime, memoized per minute.
+    '''
+    # Amsterdam offsets are whole hours, so the local minute follows the UTC minute
+    return _display_minute(int(time.timestamp()) // 60)
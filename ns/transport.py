@@ -0,0 +1,88 @@
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ns import metrics
+from ns.governor import governor
+
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (3.05, 10)
+# Attempts per request, including the first one
+ATTEMPTS = 3
+# Exponential backoff, base * 2^attempt capped, with full jitter
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8
+# Status codes worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+
+class TransportError(Exception):
+    pass
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+    # Keep-alive connections, shared by all threads
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_session = _create_session()
+
+# Record and replay of all traffic, see ns.replay
+recorder = None
+player = None
+
+
+def backoff(attempt: int) -> float:
+    # Seconds to wait before another attempt, also used by the feed to reconnect
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def get(url: str, endpoint: str, lane: str = 'departures', **kwargs) -> requests.Response:
+    '''
+    GET through the shared connection pool, retrying transient failures.
+    Every attempt waits for a slot of the lane from the governor.
+    Raises TransportError once all attempts are used up.
+    '''
+    if player is not None:
+        return player.response(url, endpoint)
+
+    kwargs.setdefault('timeout', TIMEOUT)
+    error = None
+    for attempt in range(ATTEMPTS):
+        if attempt > 0:
+            time.sleep(backoff(attempt))
+
+        try:
+            with governor.slot(lane):
+                start = time.perf_counter()
+                response = _session.get(url=url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.request_seconds.observe(time.perf_counter() - start, endpoint)
+            error = e
+            continue
+
+        metrics.request_seconds.observe(time.perf_counter() - start, endpoint)
+        if response.status_code in RETRY_STATUS:
+            error = f'HTTP {response.status_code}'
+            response.close()
+            continue
+
+        response.raise_for_status()
+        if recorder is not None:
+            recorder.record(url, endpoint, response)
+        return response
+    raise TransportError(f'{endpoint} failed after {ATTEMPTS} attempts: {error}')
+
+
+def get_json(url: str, endpoint: str, lane: str = 'departures'):
+    return get(url, endpoint, lane).json()
@@ -1,2 +1,17 @@
 def strike(text):
-    return ''.join([u'\u0336{}'.format(c) for c in text])
\ No newline at end of file
+    return ''.join([u'\u0336{}'.format(c) for c in text])
+
+
+def load_font(size: int):
+    # Frutiger if configured, falls back to a stock font
+    import constants
+    from PIL import ImageFont
+
+    for path in (getattr(constants, 'font_path', None), 'DejaVuSans.ttf'):
+        if path is None:
+            continue
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            pass
+    return ImageFont.load_default(size)